@@ -20,11 +20,14 @@ def main():
         'api',
         'discoverer',
         'rescan',
+        'geobench',
+        'bench',
     )
 
     parser.add_argument('cmd', choices=cmd_list, nargs='?', default='')
 
-    args = parser.parse_args()
+    # anything after the command is passed on to it, e.g. run.py bench --sizes 100,1000
+    args, rest = parser.parse_known_args()
     cmd = args.cmd
 
     if cmd == 'api':
@@ -39,6 +42,14 @@ def main():
         from stx_node_map.discoverer import rescan_only
         rescan_only()
 
+    if cmd == 'geobench':
+        from stx_node_map.discoverer import geo_benchmark
+        geo_benchmark()
+
+    if cmd == 'bench':
+        from stx_node_map.discoverer.bench import main
+        main(rest)
+
 
 if __name__ == '__main__':
     main()
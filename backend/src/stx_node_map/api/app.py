@@ -1,13 +1,33 @@
-import json
 import os
+from typing import Dict, Optional
 
-from flask import Flask, jsonify
+from flask import Flask, Response, abort, jsonify, make_response, request, stream_with_context
 from flask_cors import CORS
 
-from stx_node_map.util import file_read, assert_env_vars
+from stx_node_map.api.cache import respond
+from stx_node_map.api.events import parse_last_id
+from stx_node_map.api.history import HistoryQuery
+from stx_node_map.api.network import NetworkData
+from stx_node_map.api.query import NodeQuery
+from stx_node_map.util import env_int
+from stx_node_map.util.network import network_dir, network_names
 
 this_dir = os.path.abspath(os.path.dirname(__file__))
-file_path = os.path.join(this_dir, "..", "..", "..", "data.json")
+data_dir = os.path.join(this_dir, "..", "..", "..")
+
+# every network the discoverer maps (NETWORKS, or NETWORK), the primary one first
+network_list = network_names()
+networks: Dict[str, NetworkData] = {name: NetworkData(name, network_dir(data_dir, network_list, name))
+                                    for name in network_list}
+
+
+def get_network(name: Optional[str]) -> NetworkData:
+    """Data of the network a route is prefixed with, the primary network without prefix"""
+    data = networks.get(name or network_list[0])
+    if data is None:
+        abort(make_response(jsonify({"error": "unknown network {}".format(name)}), 404))
+
+    return data
 
 
 def __flask_setup():
@@ -16,40 +36,108 @@ def __flask_setup():
     app = Flask(__name__)
     CORS(app)
 
+    # seconds clients and proxies may reuse /nodes without revalidating
+    max_age = env_int("API_CACHE_MAX_AGE", 10)
+
+    # seconds an /events stream stays open before the client reconnects
+    events_max_seconds = env_int("API_EVENTS_MAX_SECONDS", 300)
+
     @app.route("/")
     def index():
         return "Hello"
 
-    @app.route("/nodes")
-    def nodes():
-        try:
-            data = json.loads(file_read(file_path))
-        except (FileNotFoundError, json.JSONDecodeError, ValueError):
-            # File doesn't exist, is empty, or contains invalid JSON
-            data = []
+    # every route but / and /networks serves the primary network, and any network prefixed with its name
+    @app.route("/networks")
+    def network_index():
+        return jsonify({"primary": network_list[0], "networks": network_list})
+
+    @app.route("/nodes", defaults={"network": None})
+    @app.route("/<network>/nodes")
+    def nodes(network):
+        snapshot = get_network(network).nodes.get()
+
+        if not request.args:
+            return respond(snapshot.payload, max_age)
 
-        resp = {
-            "network": assert_env_vars("NETWORK"),
-            "nodes": data
-        }
+        # filter: country, version, connection_status, node_type (comma-separated values),
+        # seen_since / stale_since (ISO timestamps); sort=[-]field; limit, cursor; fields; include_stale
+        try:
+            query = NodeQuery(request.args)
+            found, total, next_cursor = snapshot.index(query.include_stale).query(query)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify({
+            "network": snapshot.network,
+            "generation": snapshot.generation,
+            "total": total,
+            "next_cursor": next_cursor,
+            "nodes": found
+        })
+
+    @app.route("/stats", defaults={"network": None})
+    @app.route("/<network>/stats")
+    def stats(network):
+        # aggregates computed by the discoverer for each published snapshot
+        return respond(get_network(network).stats.get(), max_age)
+
+    @app.route("/status", defaults={"network": None})
+    @app.route("/<network>/status")
+    def status(network):
+        return respond(get_network(network).status.get(), 0)
+
+    @app.route("/graph", defaults={"network": None})
+    @app.route("/<network>/graph")
+    def graph(network):
+        # peer links of the last discovery walk, streamed: nodes are addresses, edges index into them
+        snapshot = get_network(network).graph.get()
+        resp = Response(snapshot.stream(), mimetype="application/json")
+        resp.cache_control.public = True
+        resp.cache_control.max_age = max_age
+        return resp
+
+    @app.route("/graph/stats", defaults={"network": None})
+    @app.route("/<network>/graph/stats")
+    def graph_stats(network):
+        # degree distribution, connected components and reachability of the last walk
+        return respond(get_network(network).graph.get().stats, max_age)
+
+    @app.route("/history/uptime", defaults={"network": None})
+    @app.route("/<network>/history/uptime")
+    def history_uptime(network):
+        # share of observations each node was reachable in, optionally for one address
+        history = get_network(network).history
+        try:
+            query = HistoryQuery(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        return jsonify(resp)
+        return jsonify(dict(query.range(), nodes=history.uptime(query)))
 
-    @app.route("/status")
-    def status():
-        status_path = os.path.join(this_dir, "..", "..", "..", "status.json")
+    @app.route("/history/versions", defaults={"network": None})
+    @app.route("/<network>/history/versions")
+    def history_versions(network):
+        # nodes per version in every bucket (seconds, a day by default)
+        history = get_network(network).history
         try:
-            data = json.loads(file_read(status_path))
-        except FileNotFoundError:
-            data = {
-                "status": "Unknown",
-                "nodes_count": 0,
-                "scanning": False,
-                "last_scan": None,
-                "timestamp": None
-            }
-
-        return jsonify(data)
+            query = HistoryQuery(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify(dict(query.range(), bucket=query.bucket, series=history.versions(query)))
+
+    @app.route("/events", defaults={"network": None})
+    @app.route("/<network>/events")
+    def events(network):
+        # status, node_added, node_changed and node_removed events as server-sent events,
+        # resumed from the Last-Event-ID header (or ?last_event_id=) after a reconnect
+        event_log = get_network(network).events
+        last_id = parse_last_id(request.headers.get("Last-Event-ID") or request.args.get("last_event_id"))
+        resp = Response(stream_with_context(event_log.stream(last_id, events_max_seconds)),
+                        mimetype="text/event-stream")
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["X-Accel-Buffering"] = "no"
+        return resp
 
 
 def __run_dev_server():
@@ -0,0 +1,73 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+from flask import Response, request
+
+from stx_node_map.util import file_read
+
+
+class Payload:
+    """JSON response body serialized and gzipped once, served many times"""
+
+    def __init__(self, doc: Any):
+        self.body = json.dumps(doc, separators=(",", ":")).encode()
+        self.gzipped = gzip.compress(self.body, compresslevel=6)
+        self.etag = hashlib.blake2b(self.body, digest_size=12).hexdigest()
+
+
+def respond(payload: Payload, max_age: int) -> Response:
+    """Serve a payload, honouring If-None-Match and Accept-Encoding"""
+    if request.if_none_match.contains(payload.etag):
+        resp = Response(status=304)
+    elif request.accept_encodings["gzip"]:
+        resp = Response(payload.gzipped, mimetype="application/json")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response(payload.body, mimetype="application/json")
+
+    resp.set_etag(payload.etag)
+    resp.vary.add("Accept-Encoding")
+    resp.cache_control.public = True
+    resp.cache_control.max_age = max_age
+    return resp
+
+
+class FileCache:
+    """Value built from a JSON file, rebuilt only when the file changes
+
+    The file is identified by inode, size and mtime. The discoverer
+    replaces its files by renaming, so every new snapshot has a new inode
+    and checking for one costs a single stat() per request.
+    """
+
+    def __init__(self, path: str, build: Callable[[Any], Any], default: Any):
+        self.path = path
+        self.build = build
+        self.default = default
+        self._key: Optional[Tuple[int, int, int]] = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        try:
+            st = os.stat(self.path)
+            key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            key = None
+
+        with self._lock:
+            if self._value is None or key != self._key:
+                try:
+                    data = json.loads(file_read(self.path)) if key is not None else self.default
+                except (OSError, ValueError):
+                    # File vanished or contains invalid JSON
+                    data = self.default
+
+                self._value = self.build(data)
+                self._key = key
+
+            return self._value
@@ -0,0 +1,97 @@
+import sqlite3
+import time
+from typing import Iterator, List, Optional, Tuple
+
+# seconds between checks for new events, and between keepalive comments
+POLL_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15.0
+
+# events sent per read, a client far behind catches up in several
+BATCH_SIZE = 500
+
+
+class EventLog:
+    """Read-only view of the events table the discoverer appends to in nodes.db"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        try:
+            return sqlite3.connect("file:{}?mode=ro".format(self.path), uri=True, timeout=5.0)
+        except sqlite3.OperationalError:
+            # the discoverer hasn't created the database yet
+            return None
+
+    @staticmethod
+    def read(conn: sqlite3.Connection, after: int) -> List[Tuple[int, str, str]]:
+        return conn.execute(
+            "SELECT id, type, data FROM events WHERE id > ? ORDER BY id LIMIT ?", (after, BATCH_SIZE)
+        ).fetchall()
+
+    @staticmethod
+    def bounds(conn: sqlite3.Connection) -> Tuple[int, int]:
+        """(oldest, newest) retained event ids, (0, 0) when there are none"""
+        oldest, newest = conn.execute("SELECT MIN(id), MAX(id) FROM events").fetchone()
+        return oldest or 0, newest or 0
+
+    def stream(self, last_id: Optional[int], max_seconds: float) -> Iterator[str]:
+        """Server-sent events after last_id, or from now on without one
+
+        Ends after max_seconds so a long-lived stream doesn't pin a worker
+        forever, browsers reconnect on their own sending the id of the last
+        event they saw. A client whose last_id was already trimmed from the
+        log, or is ahead of it because nodes.db was recreated, gets a
+        "reset" event and should refetch /nodes.
+        """
+        conn = self._connect()
+        if conn is None:
+            yield "retry: 5000\n\n"
+            return
+
+        try:
+            try:
+                oldest, newest = self.bounds(conn)
+            except sqlite3.OperationalError:
+                # no events table yet, or the database is locked for longer than the timeout
+                yield "retry: 5000\n\n"
+                return
+
+            yield "retry: 1000\n\n"
+
+            if last_id is None:
+                last_id = newest
+            elif last_id > newest or (oldest and last_id < oldest - 1):
+                yield "id: {}\nevent: reset\ndata: {{}}\n\n".format(newest)
+                last_id = newest
+
+            started = time.monotonic()
+            last_sent = started
+
+            while time.monotonic() - started < max_seconds:
+                rows = self.read(conn, last_id)
+
+                for event_id, type_, data in rows:
+                    yield "id: {}\nevent: {}\ndata: {}\n\n".format(event_id, type_, data)
+                    last_id = event_id
+
+                now = time.monotonic()
+                if rows:
+                    last_sent = now
+                    if len(rows) == BATCH_SIZE:
+                        continue
+                elif now - last_sent >= KEEPALIVE_INTERVAL:
+                    yield ": keepalive\n\n"
+                    last_sent = now
+
+                time.sleep(POLL_INTERVAL)
+        finally:
+            conn.close()
+
+
+def parse_last_id(value: Optional[str]) -> Optional[int]:
+    if value is None or not value.strip().isdigit():
+        return None
+
+    return int(value)
+
@@ -0,0 +1,40 @@
+import json
+from typing import Iterator, Optional
+
+from stx_node_map.api.cache import Payload
+from stx_node_map.util.graph import PeerGraph
+
+# links sent per chunk of the /graph stream
+CHUNK_EDGES = 4096
+
+
+class GraphSnapshot:
+    """The peer graph of the discoverer's last walk, as written to graph.json"""
+
+    def __init__(self, data: Optional[dict]):
+        data = data or {}
+        self.generation = data.get("generation")
+        self.graph = PeerGraph.from_json(data) if "nodes" in data else PeerGraph.build({})
+        self.stats = Payload({
+            "generation": self.generation,
+            "computed_at": data.get("computed_at"),
+            "analytics": data.get("analytics")
+        })
+
+    def stream(self) -> Iterator[str]:
+        """{"generation", "nodes": [addresses], "edges": [[i, j], ...]} in chunks, edges index into nodes"""
+        yield '{{"generation":{},"nodes":{},"edges":['.format(json.dumps(self.generation),
+                                                            json.dumps(self.graph.nodes, separators=(",", ":")))
+
+        chunk = []
+        first = True
+        for u, v in self.graph.edges():
+            chunk.append("[{},{}]".format(u, v))
+            if len(chunk) == CHUNK_EDGES:
+                yield ("" if first else ",") + ",".join(chunk)
+                chunk, first = [], False
+
+        if chunk:
+            yield ("" if first else ",") + ",".join(chunk)
+
+        yield "]}"
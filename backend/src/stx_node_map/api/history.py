@@ -0,0 +1,82 @@
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime
+from typing import Optional
+
+from stx_node_map.util import parse_timestamp, series
+
+DEFAULT_RANGE = 7 * 86400
+
+# smallest version adoption bucket, matches the resolution of downsampled history
+MIN_BUCKET = 3600
+
+
+def _timestamp(value: str, name: str) -> int:
+    return int(parse_timestamp(value, name).timestamp())
+
+
+class HistoryQuery:
+    """Parsed /history/* query string: since, until (ISO timestamps, last 7 days by default), bucket, address"""
+
+    def __init__(self, args):
+        self.until = _timestamp(args["until"], "until") if "until" in args else int(time.time())
+        self.since = _timestamp(args["since"], "since") if "since" in args else self.until - DEFAULT_RANGE
+
+        if self.since >= self.until:
+            raise ValueError("since must be before until")
+
+        try:
+            self.bucket = int(args.get("bucket", 86400))
+        except ValueError:
+            raise ValueError("bucket must be an integer")
+
+        if self.bucket < MIN_BUCKET:
+            raise ValueError("bucket must be at least {} seconds".format(MIN_BUCKET))
+
+        self.address: Optional[str] = args.get("address")
+
+    def range(self) -> dict:
+        return {
+            "since": datetime.utcfromtimestamp(self.since).isoformat(),
+            "until": datetime.utcfromtimestamp(self.until).isoformat()
+        }
+
+
+class HistoryReader:
+    """Read-only queries over the history.db the discoverer writes"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        try:
+            conn = sqlite3.connect("file:{}?mode=ro".format(self.path), uri=True, timeout=5.0)
+        except sqlite3.OperationalError:
+            # no history recorded yet
+            return None
+
+        try:
+            conn.execute("SELECT 1 FROM chunks LIMIT 1")
+        except sqlite3.OperationalError:
+            # the discoverer hasn't created the table yet
+            conn.close()
+            return None
+
+        return conn
+
+    def uptime(self, q: HistoryQuery) -> list:
+        conn = self._connect()
+        if conn is None:
+            return []
+
+        with closing(conn):
+            return series.uptime(conn, q.since, q.until, q.address)
+
+    def versions(self, q: HistoryQuery) -> list:
+        conn = self._connect()
+        if conn is None:
+            return []
+
+        with closing(conn):
+            return series.version_adoption(conn, q.since, q.until, q.bucket)
@@ -0,0 +1,41 @@
+import os
+
+from stx_node_map.api.cache import FileCache, Payload
+from stx_node_map.api.events import EventLog
+from stx_node_map.api.graph import GraphSnapshot
+from stx_node_map.api.history import HistoryReader
+from stx_node_map.api.query import NodeSnapshot
+
+
+def build_document(data) -> Payload:
+    return Payload(data)
+
+
+class NetworkData:
+    """Caches of the data files the discoverer writes for one network"""
+
+    def __init__(self, name: str, directory: str):
+        self.name = name
+        self.nodes = FileCache(os.path.join(directory, "data.json"), self.build_nodes, [])
+        self.stats = FileCache(os.path.join(directory, "stats.json"), build_document,
+                               {"generation": None, "nodes_count": 0})
+        self.status = FileCache(os.path.join(directory, "status.json"), build_document, {
+            "status": "Unknown",
+            "nodes_count": 0,
+            "scanning": False,
+            "last_scan": None,
+            "timestamp": None
+        })
+        self.graph = FileCache(os.path.join(directory, "graph.json"), GraphSnapshot, None)
+        self.events = EventLog(os.path.join(directory, "nodes.db"))
+        self.history = HistoryReader(os.path.join(directory, "history.db"))
+
+    def build_nodes(self, data) -> NodeSnapshot:
+        # snapshots are {"generation": ..., "nodes": [...]}, older ones a bare list
+        if isinstance(data, dict):
+            generation = data.get("generation")
+            data = data.get("nodes", [])
+        else:
+            generation = None
+
+        return NodeSnapshot(self.name, generation, data)
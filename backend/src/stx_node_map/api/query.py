@@ -0,0 +1,214 @@
+import base64
+import binascii
+import json
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+from stx_node_map.api.cache import Payload
+from stx_node_map.util import parse_timestamp
+from stx_node_map.util.version import version_key
+
+MAX_LIMIT = 1000
+
+
+def _country(node: dict) -> Optional[str]:
+    return (node.get("location") or {}).get("country")
+
+
+def _version(node: dict) -> Optional[str]:
+    return (node.get("version") or {}).get("version")
+
+
+# fields /nodes can be filtered on, by exact match
+FILTERS: Dict[str, Callable[[dict], Optional[str]]] = {
+    "country": _country,
+    "version": _version,
+    "connection_status": lambda n: n.get("connection_status"),
+    "node_type": lambda n: n.get("node_type"),
+}
+
+
+def _timestamp(value: str, name: str) -> str:
+    """An ISO timestamp as comparable to the stored ones: naive UTC isoformat"""
+    return parse_timestamp(value, name).replace(tzinfo=None).isoformat()
+
+
+# orderings /nodes can be sorted by as (value missing, value), ties are broken by address;
+# nodes missing the value come last in either direction
+SORTS: Dict[str, Callable[[dict], tuple]] = {
+    "address": lambda n: (False,),
+    "last_seen": lambda n: (n.get("last_seen") is None, n.get("last_seen") or ""),
+    "burn_block_height": lambda n: (n.get("burn_block_height") is None, n.get("burn_block_height") or 0),
+    "version": lambda n: (_version(n) is None, version_key(_version(n))),
+    "country": lambda n: (_country(n) is None, _country(n) or ""),
+}
+
+
+class NodeQuery:
+    """Parsed /nodes query string"""
+
+    def __init__(self, args):
+        self.filters = {}
+        for name in FILTERS:
+            if name in args:
+                self.filters[name] = set(args[name].split(","))
+
+        self.seen_since = _timestamp(args["seen_since"], "seen_since") if "seen_since" in args else None
+        self.stale_since = _timestamp(args["stale_since"], "stale_since") if "stale_since" in args else None
+
+        sort = args.get("sort", "address")
+        self.descending = sort.startswith("-")
+        self.sort = sort.lstrip("-")
+        if self.sort not in SORTS:
+            raise ValueError("Cannot sort by {}".format(self.sort))
+
+        try:
+            self.limit = int(args["limit"]) if "limit" in args else None
+        except ValueError:
+            raise ValueError("limit must be an integer")
+
+        if self.limit is not None and not 0 < self.limit <= MAX_LIMIT:
+            raise ValueError("limit must be between 1 and {}".format(MAX_LIMIT))
+
+        self.after = None
+        if "cursor" in args:
+            try:
+                sort, self.after = json.loads(base64.urlsafe_b64decode(args["cursor"].encode()))
+            except (ValueError, TypeError, binascii.Error):
+                raise ValueError("Invalid cursor")
+
+            if not isinstance(sort, str) or not isinstance(self.after, str):
+                raise ValueError("Invalid cursor")
+
+            if sort != args.get("sort", "address"):
+                raise ValueError("Cursor belongs to a different sort order")
+
+            if self.limit is None:
+                self.limit = MAX_LIMIT
+
+        self.fields = set(args["fields"].split(",")) | {"address"} if "fields" in args else None
+
+        # stale nodes are left out unless asked for
+        self.include_stale = args.get("include_stale", "").lower() in ("1", "true", "yes")
+
+    def cursor(self, address: str) -> str:
+        sort = ("-" if self.descending else "") + self.sort
+        return base64.urlsafe_b64encode(json.dumps([sort, address]).encode()).decode()
+
+
+class NodeIndex:
+    """Lookup structures over the nodes of one snapshot
+
+    Built once per snapshot so a query touches only the nodes it returns:
+    value -> positions maps for every filter, positions ordered by
+    last_seen for the time range filters, and a precomputed ordering (and
+    rank of every node in it) for every sort key in both directions.
+    """
+
+    def __init__(self, nodes: List[dict]):
+        self.nodes = [n for n in nodes if isinstance(n, dict) and n.get("address")]
+        self.positions = {n["address"]: i for i, n in enumerate(self.nodes)}
+
+        self.by_value: Dict[str, Dict[Optional[str], List[int]]] = {name: {} for name in FILTERS}
+        for i, node in enumerate(self.nodes):
+            for name, get in FILTERS.items():
+                self.by_value[name].setdefault(get(node), []).append(i)
+
+        seen = sorted((n.get("last_seen") or "", i) for i, n in enumerate(self.nodes))
+        self.seen_values = [s for s, _ in seen]
+        self.seen_positions = [i for _, i in seen]
+
+        self.orders: Dict[Tuple[str, bool], List[int]] = {}
+        self.ranks: Dict[Tuple[str, bool], List[int]] = {}
+        for name, get in SORTS.items():
+            keys = [get(n) for n in self.nodes]
+            ascending = sorted(range(len(self.nodes)), key=lambda i: (keys[i], self.nodes[i]["address"]))
+            present = [i for i in ascending if not keys[i][0]]
+            missing = [i for i in ascending if keys[i][0]]
+
+            for descending, order in ((False, ascending), (True, present[::-1] + missing)):
+                rank = [0] * len(order)
+                for r, i in enumerate(order):
+                    rank[i] = r
+
+                self.orders[name, descending] = order
+                self.ranks[name, descending] = rank
+
+    def _candidates(self, q: NodeQuery) -> Optional[set]:
+        """Positions matching the filters, None when nothing is filtered"""
+        sets = []
+
+        for name, values in q.filters.items():
+            matches = set()
+            for value in values:
+                matches.update(self.by_value[name].get(value, ()))
+            sets.append(matches)
+
+        if q.seen_since is not None or q.stale_since is not None:
+            lo = bisect_left(self.seen_values, q.seen_since) if q.seen_since is not None else 0
+            hi = bisect_left(self.seen_values, q.stale_since) if q.stale_since is not None else len(self.seen_values)
+            sets.append(set(self.seen_positions[lo:hi]))
+
+        if not sets:
+            return None
+
+        sets.sort(key=len)
+        result = sets[0]
+        for s in sets[1:]:
+            result = result & s
+
+        return result
+
+    def query(self, q: NodeQuery):
+        """Returns (matching nodes, total matches, cursor of the next page or None)"""
+        rank = self.ranks[q.sort, q.descending]
+        start = None
+
+        if q.after is not None:
+            if q.after not in self.positions:
+                raise ValueError("Cursor expired")
+            start = rank[self.positions[q.after]]
+
+        candidates = self._candidates(q)
+
+        if candidates is None:
+            # unfiltered: slice the precomputed ordering directly
+            order = self.orders[q.sort, q.descending]
+            total = len(order)
+            lo = start + 1 if start is not None else 0
+            page = order[lo:lo + q.limit] if q.limit is not None else order[lo:]
+            more = lo + len(page) < len(order)
+        else:
+            total = len(candidates)
+            if start is not None:
+                candidates = [i for i in candidates if rank[i] > start]
+
+            ordered = sorted(candidates, key=rank.__getitem__)
+            page = ordered[:q.limit] if q.limit is not None else ordered
+            more = len(page) < len(ordered)
+
+        nodes = [self.nodes[i] for i in page]
+        if q.fields is not None:
+            nodes = [{k: v for k, v in n.items() if k in q.fields} for n in nodes]
+
+        next_cursor = q.cursor(self.nodes[page[-1]]["address"]) if more and page else None
+        return nodes, total, next_cursor
+
+
+class NodeSnapshot:
+    """A published node snapshot as served by the API, stale nodes only on request"""
+
+    def __init__(self, network: str, generation: Optional[int], nodes: List[dict]):
+        self.network = network
+        self.generation = generation
+        self.nodes = nodes
+        self.active = [n for n in nodes if not (isinstance(n, dict) and n.get("stale_at"))]
+        self.payload = Payload({"network": network, "generation": generation, "nodes": self.active})
+        self._indexes: Dict[bool, NodeIndex] = {}
+
+    def index(self, include_stale: bool = False) -> NodeIndex:
+        """Built on the first filtered request, plain /nodes requests never need it"""
+        if include_stale not in self._indexes:
+            self._indexes[include_stale] = NodeIndex(self.nodes if include_stale else self.active)
+
+        return self._indexes[include_stale]
@@ -1,14 +1,25 @@
-import json
+import asyncio
+import atexit
 import logging
 import os
-import socket
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime, timedelta
-
-import requests
-
-from stx_node_map.util import file_write, assert_env_vars
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+from stx_node_map.discoverer import metrics
+from stx_node_map.discoverer.address import is_private_ip, public_addresses
+from stx_node_map.discoverer.crawl import crawl
+from stx_node_map.discoverer.geo import GeoBackend, GeoCache, GeoJSBackend, GeoResult, OfflineBackend, benchmark, \
+    locate
+from stx_node_map.discoverer.network import Network, networks_from_env
+from stx_node_map.discoverer.node import Location, NodeRecord, PRIVATE_LOCATION, UNKNOWN_LOCATION
+from stx_node_map.discoverer.probe import Prober, ProbeLoop
+from stx_node_map.discoverer.schedule import RescanScheduler, drain, summarize
+from stx_node_map.discoverer.shard import ShardPool
+from stx_node_map.util import assert_env_vars, env_int
+from stx_node_map.util.graph import PeerGraph
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,288 +29,68 @@ logging.basicConfig(
 
 this_dir = os.path.abspath(os.path.dirname(__file__))
 
+# where the data files live, the backend directory: the files of the primary network and the
+# shared geo_cache.db, other networks get a subdirectory named after them
+data_dir = os.path.join(this_dir, "..", "..", "..")
 
-def is_private_ip(ip: str) -> bool:
-    """Check if an IP address is private (RFC 1918) or special use"""
-    try:
-        parts = [int(x) for x in ip.split('.')]
-        if len(parts) != 4:
-            return True  # Invalid format, skip
-        
-        # 10.0.0.0/8
-        if parts[0] == 10:
-            return True
-        
-        # 172.16.0.0/12
-        if parts[0] == 172 and 16 <= parts[1] <= 31:
-            return True
-        
-        # 192.168.0.0/16
-        if parts[0] == 192 and parts[1] == 168:
-            return True
-        
-        # 127.0.0.0/8 (localhost)
-        if parts[0] == 127:
-            return True
-        
-        # 169.254.0.0/16 (link-local)
-        if parts[0] == 169 and parts[1] == 254:
-            return True
-        
-        # 0.0.0.0
-        if parts[0] == 0:
-            return True
-        
-        return False
-    except:
-        return True  # Invalid IP, skip
-
-
-def check_port_open(host: str, port: int, timeout: float = 2.0) -> bool:
-    """Check if a TCP port is open on the host"""
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(timeout)
-        result = sock.connect_ex((host, port))
-        sock.close()
-        return result == 0
-    except:
-        return False
+geo_cache: Optional[GeoCache] = None
+geo_cache_lock = threading.Lock()
 
+offline_geo: Optional[OfflineBackend] = None
 
-def ip_to_location(ip: str):
-    """Fetch geolocation from GeoJS.io (unlimited calls, no rate limits)"""
-    url = "https://get.geojs.io/v1/geo/{}.json".format(ip)
-    try:
-        resp = requests.get(url, timeout=5)
-    except BaseException:
-        return None
+probe_loop: Optional[ProbeLoop] = None
+probe_loop_lock = threading.Lock()
 
-    if resp.status_code != 200:
-        return None
+shard_pool: Optional[ShardPool] = None
+shard_pool_lock = threading.Lock()
+# called with every shard's Prober before it opens, the benchmark points them at its simulated network
+shard_setup: Optional[Callable[[Prober], None]] = None
 
-    try:
-        data = resp.json()
-    except:
-        return None
-    
-    # Safely convert coordinates, handling "nil" or invalid values
-    try:
-        lat = data.get("latitude", 0)
-        lon = data.get("longitude", 0)
-        latitude = float(lat) if lat not in (None, "", "nil") else 0.0
-        longitude = float(lon) if lon not in (None, "", "nil") else 0.0
-    except (ValueError, TypeError):
-        return None
-    
-    # Map GeoJS response to our format - return None if essential data is missing
-    if not data.get("country") and latitude == 0.0 and longitude == 0.0:
-        return None
-    
-    return {
-        "latitude": latitude,
-        "longitude": longitude,
-        "country_name": data.get("country", ""),
-        "city": data.get("city", "")
-    }
-
-
-def should_fetch_geolocation(known_nodes: dict, ip: str) -> bool:
-    """Check if we should fetch geolocation for this IP (only once per month)"""
-    if ip not in known_nodes:
-        return True  # New node, fetch location
-    
-    node = known_nodes[ip]
-    if "location_fetched_at" not in node:
-        return True  # No timestamp, fetch location
-    
-    last_fetch = datetime.fromisoformat(node["location_fetched_at"])
-    if datetime.utcnow() - last_fetch > timedelta(days=30):
-        return True  # More than 30 days old, fetch again
-    
-    return False  # Recently fetched, skip
+networks: Optional[List[Network]] = None
+networks_lock = threading.Lock()
 
+# geolocation lookups in progress, shared by the walks of all networks
+geo_pending: Dict[str, asyncio.Future] = {}
 
-def make_core_api_url(host: str, endpoint: str = "neighbors"):
-    if "stack" in host:
-        return "http://{}/v2/{}".format(host, endpoint)
 
-    return "http://{}:20443/v2/{}".format(host, endpoint)
+def data_path(name: str) -> str:
+    """Path of a shared data file in the data directory"""
+    return os.path.join(data_dir, name)
 
 
-def get_server_version(host: str):
-    url = make_core_api_url(host, "info")
-    try:
-        resp = requests.get(url, timeout=4).json()
-        return resp.get("server_version")
-    except BaseException:
-        return None
+def get_networks() -> List[Network]:
+    """Networks this process maps (NETWORKS, or NETWORK), the primary one first"""
+    global networks
 
+    with networks_lock:
+        if networks is None:
+            networks = networks_from_env(data_dir)
 
-def get_node_info(host: str):
-    """Fetch /v2/info for a node and extract version details and burn_block_height
-    
-    Returns dict with:
-    - server_version, version, burn_block_height: node info (if API available)
-    - api_available: True if port 20443 responded
-    - p2p_available: True if port 20444 is open
-    - stacker_db_count: Number of Stacker DBs (from stackerdbs property)
-    """
-    url = make_core_api_url(host, "info")
-    api_available = False
-    p2p_available = False
-    stacker_db_count = 0
-    
-    try:
-        resp = requests.get(url, timeout=10).json()
-        api_available = True
-        
-        # Extract Stacker DB count from response
-        if "stackerdbs" in resp:
-            stacker_db_count = len(resp.get("stackerdbs", []))
-        
-        # Parse server_version string (e.g., "stacks-node 2.5.0.0.0 (master:abc123, release, linux [x86_64])")
-        server_version = resp.get("server_version", "")
-        version_info = {
-            "version": None,
-            "commit_hash": None,
-            "build_type": None,
-            "platform": None
-        }
-        
-        if server_version:
-            # Extract version number - find the numeric version part after "stacks-node "
-            # Example: "stacks-node 3.3.0.0.3 (6048975+, release build, linux [x86_64])"
-            parts = server_version.split()
-            for part in parts:
-                # Look for a part that starts with a digit (version number)
-                if part and part[0].isdigit():
-                    # Extract just the version, removing any trailing parenthesis
-                    version_info["version"] = part.split("(")[0]
-                    break
-            
-            # Extract commit, build type, and platform from parentheses
-            if "(" in server_version and ")" in server_version:
-                paren_content = server_version[server_version.find("(")+1:server_version.find(")")]
-                paren_parts = [p.strip() for p in paren_content.split(",")]
-                
-                if len(paren_parts) > 0 and paren_parts[0]:
-                    # Commit hash (e.g., "master:abc123" or "abc123" or "6048975+")
-                    commit_part = paren_parts[0]
-                    if ":" in commit_part:
-                        version_info["commit_hash"] = commit_part.split(":")[1]
-                    else:
-                        version_info["commit_hash"] = commit_part
-                
-                # Build type might be "release build" or just "release"
-                for part in paren_parts[1:]:
-                    if "release" in part.lower() or "debug" in part.lower():
-                        version_info["build_type"] = part
-                        break
-                
-                # Platform is usually the last part with brackets
-                for part in paren_parts:
-                    if "[" in part and "]" in part:
-                        version_info["platform"] = part
-                        break
-        
-        return {
-            "server_version": server_version,
-            "version": version_info,
-            "burn_block_height": resp.get("burn_block_height"),
-            "api_available": api_available,
-            "p2p_available": None,  # Don't check P2P if API works
-            "stacker_db_count": stacker_db_count
-        }
-    except BaseException:
-        # API failed, check if P2P port is open
-        p2p_available = check_port_open(host, 20444, timeout=3.0)
-        
-        return {
-            "server_version": None,
-            "version": {"version": None, "commit_hash": None, "build_type": None, "platform": None},
-            "burn_block_height": None,
-            "api_available": api_available,
-            "p2p_available": p2p_available,
-            "stacker_db_count": 0
-        }
-
-
-def get_neighbors(host: str):
-    url = make_core_api_url(host, "neighbors")
-    try:
-        json = requests.get(url, timeout=4).json()
-    except BaseException:
-        return []
-
-    # collect all ip addresses
-    all_ = [x["ip"] for x in json["sample"]] + [x["ip"] for x in json["inbound"]] + [x["ip"] for x in json["outbound"]]
-
-    # make the list unique
-    unique = list(set(all_))
-
-    # skip private addresses
-    return [a for a in unique if not is_private_ip(a)]
-
-
-def scan_list(list_):
-    found = []
-
-    for address in list_:
-        logging.info("Scanning {}".format(address))
-        neighbors = get_neighbors(address)
-        found += [n for n in neighbors if n not in found]
-
-    return found
-
-
-def rescan_nodes_info(addresses):
-    """Concurrently fetch /v2/info for multiple nodes"""
-    results = {}
-    
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_address = {executor.submit(get_node_info, addr): addr for addr in addresses}
-        
-        for future in as_completed(future_to_address):
-            address = future_to_address[future]
-            try:
-                info = future.result()
-                results[address] = info
-                version_str = info.get("version", {}).get("version", "unknown")
-                logging.info("Updated info for {}: {}".format(address, version_str))
-            except Exception as e:
-                logging.error("Error fetching info for {}: {}".format(address, e))
-                results[address] = {
-                    "server_version": None,
-                    "version": {"version": None, "commit_hash": None, "build_type": None, "platform": None},
-                    "burn_block_height": None
-                }
-    
-    return results
+    return networks
 
 
-def load_known_nodes():
-    """Load known nodes from data.json"""
-    save_path = os.path.join(this_dir, "..", "..", "..", "data.json")
-    if not os.path.exists(save_path):
-        return {}
-    
-    try:
-        with open(save_path, 'r') as f:
-            nodes = json.load(f)
-        # Convert list to dict keyed by address
-        return {node.get("address"): node for node in nodes if isinstance(nodes, list)}
-    except BaseException:
-        return {}
+def get_shards() -> Optional[ShardPool]:
+    """Discovery shard processes, started on first use; None unless DISCOVERER_SHARDS is above 1"""
+    global shard_pool
+
+    count = env_int("DISCOVERER_SHARDS", 1)
+    if count <= 1:
+        return None
+
+    with shard_pool_lock:
+        if shard_pool is None:
+            shard_pool = ShardPool(count, shard_setup, metrics.served_port)
+            atexit.register(shard_pool.close)
+
+    return shard_pool
 
 
-def check_schema_version(known_nodes):
+def check_schema_version(sample_node: Optional[dict]):
     """Check if data.json has old schema (major/minor/patch/build) vs new (version/commit_hash/build_type/platform)"""
-    if not known_nodes:
+    if not sample_node:
         return True  # Empty or no data, schema is fine
     
     # Check first node for old schema indicators
-    sample_node = next(iter(known_nodes.values()))
     version_data = sample_node.get("version", {})
     
     # Old schema has major/minor/patch/build
@@ -310,317 +101,409 @@ def check_schema_version(known_nodes):
     return True
 
 
-def write_status(status, nodes_count=0, scanning=False, last_scan=None):
-    """Write discovery status to status.json"""
-    status_path = os.path.join(this_dir, "..", "..", "..", "status.json")
-    status_data = {
-        "status": status,
-        "nodes_count": nodes_count,
-        "scanning": scanning,
-        "last_scan": last_scan or datetime.utcnow().isoformat(),
-        "timestamp": datetime.utcnow().isoformat()
-    }
-    file_write(status_path, json.dumps(status_data))
+def get_geo_cache() -> GeoCache:
+    """Geolocation cache shared by every job of this process"""
+    global geo_cache
+
+    with geo_cache_lock:
+        if geo_cache is None:
+            geo_cache = GeoCache.from_env(data_path("geo_cache.db"))
+
+    return geo_cache
+
+
+def get_offline_geo() -> OfflineBackend:
+    """Offline range database from DISCOVERER_GEO_DB, loaded once per process"""
+    global offline_geo
+
+    with geo_cache_lock:
+        if offline_geo is None:
+            offline_geo = OfflineBackend(assert_env_vars("DISCOVERER_GEO_DB"))
+
+    return offline_geo
+
+
+def preload_geo():
+    """Load the offline range database up front if it is the geolocation backend
+
+    Parsing a full DB5 file takes seconds, on the probe loop it would stall
+    every probe in flight, so the entry points load it before any job runs.
+    """
+    if os.environ.get("DISCOVERER_GEO_BACKEND", "geojs") == "offline":
+        get_offline_geo()
+
+
+def get_geo_backend(prober: Prober) -> GeoBackend:
+    """Geolocation backend selected by DISCOVERER_GEO_BACKEND (geojs or offline)"""
+    name = os.environ.get("DISCOVERER_GEO_BACKEND", "geojs")
+
+    if name == "offline":
+        return get_offline_geo()
+
+    if name != "geojs":
+        raise AssertionError("Unknown DISCOVERER_GEO_BACKEND {}".format(name))
+
+    return GeoJSBackend(prober)
+
+
+async def geolocate(prober: Prober, ips: List[str]) -> GeoResult:
+    """Locate IPs through the geo cache, logging the lookups that went to the backend"""
+    backend = get_geo_backend(prober)
+    geo = await locate(backend, get_geo_cache(), ips, geo_pending)
+
+    # Log geolocation attempts
+    geoloc_log = data_path(os.path.join("logs", "geolocation.log"))
+    os.makedirs(os.path.dirname(geoloc_log), exist_ok=True)
+
+    with open(geoloc_log, "a") as f:
+        for address, location in geo.looked_up.items():
+            if location is not None:
+                logging.info("✓ Fetched geolocation for {}: {}, {}".format(address, location["city"], location["country_name"]))
+                f.write("{} | {} | SUCCESS | {}, {}\n".format(datetime.utcnow().isoformat(), address, location["city"], location["country_name"]))
+            else:
+                logging.warning("✗ Failed geolocation for {}".format(address))
+                f.write("{} | {} | FAILURE\n".format(datetime.utcnow().isoformat(), address))
+
+    if backend.cacheable:
+        logging.info("Located {} addresses ({} from cache, {} looked up)".format(
+            len(ips), len(ips) - len(geo.looked_up), len(geo.looked_up)))
+    else:
+        logging.info("Located {} addresses from the {} database".format(len(ips), backend.name))
+
+    return geo
+
+
+def _run(job):
+    """Run a discoverer job on the process-wide probe loop"""
+    global probe_loop
+
+    with probe_loop_lock:
+        if probe_loop is None:
+            probe_loop = ProbeLoop(Prober.from_env())
+            atexit.register(probe_loop.close)
+
+    return probe_loop.run(job)
 
 
 def worker():
-    write_status("Starting discovery walk", scanning=True)
+    _run(_worker)
+
+
+async def _worker(prober: Prober):
+    """One discovery walk of every network, side by side"""
+    await asyncio.gather(*[_walk(prober, network) for network in get_networks()])
+
+
+def connection_status(node_info: dict) -> str:
+    """api when /v2/info answered, p2p_only when only the P2P port is open, else offline"""
+    if node_info.get("api_available", False):
+        return "api"
+
+    if node_info.get("p2p_available"):
+        return "p2p_only"
+
+    return "offline"
+
+
+async def _probe_node(prober: Prober, address: str, neighbors: Optional[List[str]], port: int = 20443,
+                      p2p_port: int = 20444):
+    """Run the neighbor and info probes of one node concurrently
+
+    Neighbors already fetched during the walk are reused, private addresses
+    get no info probe.
+    """
+    async def known(value):
+        return value
+
+    neighbors, node_info = await asyncio.gather(
+        known(neighbors) if neighbors is not None else prober.get_neighbors(address, port),
+        known({}) if is_private_ip(address) else prober.get_node_info(address, port, p2p_port)
+    )
+
+    return address, neighbors, node_info
+
+
+def node_record(address: str, neighbors: List[str], node_info: dict, location: Optional[dict],
+                fetched_at: Optional[float]) -> NodeRecord:
+    """Node record of a walk from its neighbors, get_node_info result and geolocation"""
+    record = NodeRecord(address)
+
+    # Determine node type based on neighbors
+    is_public = len(neighbors) > 0
+    record.node_type = "public" if is_public else "private"
+
+    # Determine connection status
+    status = connection_status(node_info)
+    if status == "p2p_only":
+        logging.info("{} - P2P port open, API unavailable".format(address))
+    elif status == "offline":
+        logging.info("{} - Both API and P2P ports unavailable".format(address))
+
+    record.apply_info(node_info, status, datetime.utcnow().isoformat())
+
+    # Stacker DB count is only available for API nodes
+    if status == "api" and record.stacker_db_count > 0:
+        logging.info("{} - Found {} Stacker DBs".format(address, record.stacker_db_count))
+
+    if is_private_ip(address):
+        # Skip geolocation for private IPs
+        record.apply_location(PRIVATE_LOCATION)
+        logging.info("{} is a private IP address".format(address))
+    elif location is not None:
+        record.apply_location(Location.from_json(location), fetched_at)
+        logging.info("{} is a {} node with location".format(address, record.node_type))
+    elif not is_public:
+        # Private node without geolocation - mark as "Private IP"
+        record.apply_location(PRIVATE_LOCATION)
+        logging.info("{} is a private node (no geolocation attempted)".format(address))
+    else:
+        # Public node but geolocation failed - mark as "Unknown"
+        record.apply_location(UNKNOWN_LOCATION)
+        logging.info("{} is a public node but geolocation failed".format(address))
+
+    return record
+
+
+async def _probe_record(prober: Prober, address: str, neighbors: Optional[List[str]], location: Optional[dict],
+                        fetched_at: Optional[float], port: int = 20443, p2p_port: int = 20444):
+    """Probe a node and build its document, the share of a walk a discovery shard runs"""
+    address, neighbors, node_info = await _probe_node(prober, address, neighbors, port, p2p_port)
+    return address, neighbors, node_record(address, neighbors, node_info, location, fetched_at).to_json()
+
+
+async def _probe_fields(prober: Prober, address: str, port: int = 20443,
+                        p2p_port: int = 20444) -> Tuple[str, dict]:
+    """Probe a known node and return its connection status and probed fields, a rescan's share"""
+    info = await prober.get_node_info(address, port, p2p_port)
+    record = NodeRecord(address)
+    record.apply_info(info, connection_status(info), datetime.utcnow().isoformat())
+    return record.connection_status, record.to_json(NodeRecord.PROBED)
+
+
+async def _walk(prober: Prober, network: Network):
+    network.write_status("Starting discovery walk", scanning=True)
+    store = network.store
     
-    # Check if schema is outdated
-    known_nodes = load_known_nodes()
-    schema_valid = check_schema_version(known_nodes)
+    # Check if schema is outdated, the first stored node tells
+    schema_valid = check_schema_version(store.first())
     
     if not schema_valid:
         logging.info("🔄 Schema migration needed - performing full network scan")
-        known_nodes = {}  # Clear cached data to force fresh scan
+        store.clear()  # Clear cached data to force fresh scan
     
-    seed_nodes = assert_env_vars("DISCOVERER_SEED_NODES").split(",")
-    seed = []
-    
-    for node in seed_nodes:
-        neighbors = get_neighbors(node.strip())
-        seed += [n for n in neighbors if n not in seed]
-    
-    print(seed)
-    if len(seed) == 0:
-        write_status("No seed nodes found", scanning=False)
+    seed_nodes = network.seeds
+    ports = (network.api_port, network.p2p_port)
+
+    # scan, spread over the shard processes if there are any
+    shards = get_shards()
+    network.write_status("Scanning network", scanning=True)
+    with metrics.phase("worker", "walk"):
+        walk = await crawl(
+            seed_nodes,
+            partial(shards.get_neighbors if shards is not None else prober.get_neighbors, port=network.api_port),
+            max_depth=env_int("DISCOVERER_MAX_DEPTH", 4),
+            max_nodes=env_int("DISCOVERER_MAX_NODES", 10000),
+            network=network.name
+        )
+    found = walk.found
+
+    if len(found) == 0:
+        network.write_status("No seed nodes found", scanning=False)
         return
 
-    # scan
-    write_status("Scanning network", len(seed), scanning=True)
-    found = scan_list(seed)
-    found += scan_list(found)
-    found += scan_list(found)
-
-    # make list unique
-    found = list(set(found))
-
-    logging.info("{} nodes found.".format(len(found)))
+    logging.info("{} nodes found on {}.".format(len(found), network.name))
     logging.info("Detecting locations")
-    write_status("Fetching geolocation", len(found), scanning=True)
+    network.write_status("Fetching geolocation", len(found), scanning=True)
 
-    # known_nodes was already loaded and validated at start of worker()
-    # If schema was invalid, it was cleared to force fresh geolocation
-    
     # Create result list, updating with info for all nodes
     result = []
-    geolocation_calls = 0
-    geolocation_successes = 0
-    geolocation_failures = 0
-    
-    # Log geolocation attempts
-    geoloc_log = os.path.join(this_dir, "..", "..", "..", "logs", "geolocation.log")
-    os.makedirs(os.path.dirname(geoloc_log), exist_ok=True)
-    
-    for address in found:
-        # Check if this is a private IP address
-        if is_private_ip(address):
-            # Skip geolocation and node info for private IPs
-            neighbors = get_neighbors(address)
-            node_info = {}  # Empty info for private IPs
-            location = {
-                "lat": 0.0,
-                "lng": 0.0,
-                "country": "Private IP",
-                "city": ""
-            }
-            logging.info("{} is a private IP address".format(address))
-        else:
-            # Fetch info and geolocation for public IPs
-            neighbors = get_neighbors(address)
-            node_info = get_node_info(address)
-            
-            # Check if we should fetch geolocation (only once per month)
-            location = None
-            if should_fetch_geolocation(known_nodes, address):
-                location = ip_to_location(address)
-                geolocation_calls += 1
-                if location is not None:
-                    geolocation_successes += 1
-                    logging.info("✓ Fetched geolocation for {}: {}, {}".format(address, location["city"], location["country_name"]))
-                    with open(geoloc_log, "a") as f:
-                        f.write("{} | {} | SUCCESS | {}, {}\n".format(datetime.utcnow().isoformat(), address, location["city"], location["country_name"]))
-                else:
-                    geolocation_failures += 1
-                    logging.warning("✗ Failed geolocation for {}".format(address))
-                    with open(geoloc_log, "a") as f:
-                        f.write("{} | {} | FAILURE\n".format(datetime.utcnow().isoformat(), address))
-            else:
-                # Use cached location if available
-                if address in known_nodes and "location" in known_nodes[address]:
-                    location = known_nodes[address]["location"]
-                    logging.info("Using cached location for {}".format(address))
-
-        # Determine node type based on neighbors
-        is_public = len(neighbors) > 0
-        node_type = "public" if is_public else "private"
-        
-        # Determine connection status
-        api_available = node_info.get("api_available", False)
-        p2p_available = node_info.get("p2p_available")
-        
-        if api_available:
-            connection_status = "api"
-        elif p2p_available:
-            connection_status = "p2p_only"
-            logging.info("{} - P2P port open, API unavailable".format(address))
-        else:
-            connection_status = "offline"
-            logging.info("{} - Both API and P2P ports unavailable".format(address))
-        
-        # Get Stacker DB count from node_info (only available for API nodes)
-        stacker_db_count = node_info.get("stacker_db_count", 0)
-        if connection_status == "api" and stacker_db_count > 0:
-            logging.info("{} - Found {} Stacker DBs".format(address, stacker_db_count))
-        
-        # Build base item with info available to all nodes
-        item = {
-            "address": address,
-            "server_version": node_info.get("server_version"),
-            "version": node_info.get("version"),
-            "burn_block_height": node_info.get("burn_block_height"),
-            "last_seen": datetime.utcnow().isoformat(),
-            "node_type": node_type,
-            "connection_status": connection_status,
-            "stacker_db_count": stacker_db_count
-        }
-        
-        # Add location if available (for both public and private nodes)
-        if location is not None:
-            try:
-                # Handle both new format (latitude/longitude) and cached format (lat/lng)
-                lat = location.get("latitude") or location.get("lat", 0.0)
-                lng = location.get("longitude") or location.get("lng", 0.0)
-                country = location.get("country_name") or location.get("country", "Unknown")
-                city = location.get("city", "")
-                
-                item["location"] = {
-                    "lat": lat,
-                    "lng": lng,
-                    "country": country if country else "Unknown",
-                    "city": city if city else ""
-                }
-                item["location_fetched_at"] = datetime.utcnow().isoformat()
-                logging.info("{} is a {} node with location".format(address, node_type))
-            except Exception as e:
-                logging.error("Error processing location for {}: {}".format(address, e))
-                # Fall back to Unknown location
-                item["location"] = {
-                    "lat": 0.0,
-                    "lng": 0.0,
-                    "country": "Unknown",
-                    "city": ""
-                }
-        elif not is_public:
-            # Private node without geolocation - mark as "Private IP"
-            item["location"] = {
-                "lat": 0.0,
-                "lng": 0.0,
-                "country": "Private IP",
-                "city": ""
-            }
-            logging.info("{} is a private node (no geolocation attempted)".format(address))
-        else:
-            # Public node but geolocation failed - mark as "Unknown"
-            item["location"] = {
-                "lat": 0.0,
-                "lng": 0.0,
-                "country": "Unknown",
-                "city": ""
-            }
-            logging.info("{} is a public node but geolocation failed".format(address))
-
-        result.append(item)
-
-    # Preserve any previously known nodes that weren't in this scan
+    # peer lists of every found node, the topology of this walk
+    peers = {}
+
+    if shards is not None:
+        # the shards build the node documents, so they need the locations first
+        with metrics.phase("worker", "geolocate"):
+            geo = await geolocate(prober, public_addresses(found))
+
+        probing = time.perf_counter()
+        for probe in asyncio.as_completed([shards.probe(a, walk.neighbors.get(a), geo.locations.get(a),
+                                                        geo.fetched_at.get(a), *ports) for a in found]):
+            probed = await probe
+            if probed is not None:
+                address, neighbors, doc = probed
+                peers[address] = neighbors
+                result.append(doc)
+    else:
+        # Probe every node concurrently, reusing neighbor lists captured during the walk,
+        # while the locations are resolved through the geo cache
+        probing = time.perf_counter()
+        probes = [asyncio.ensure_future(_probe_node(prober, a, walk.neighbors.get(a), *ports)) for a in found]
+        with metrics.phase("worker", "geolocate"):
+            geo = await geolocate(prober, public_addresses(found))
+
+        for probe in asyncio.as_completed(probes):
+            address, neighbors, node_info = await probe
+            peers[address] = neighbors
+            result.append(node_record(address, neighbors, node_info, geo.locations.get(address),
+                                      geo.fetched_at.get(address)).to_json())
+
+    metrics.PHASE_SECONDS.labels("worker", "probe").observe(time.perf_counter() - probing)
+
+    # Previously known nodes that weren't in this scan stay in the store
     # (they may have gone offline temporarily or weren't discovered this run)
-    result_by_address = {node["address"]: node for node in result}
-    for address, known_node in known_nodes.items():
-        if address not in result_by_address:
-            result.append(known_node)
-            logging.info("Preserving previously known node {}".format(address))
-
-    save_path = os.path.join(this_dir, "..", "..", "..", "data.json")
-    file_write(save_path, json.dumps(result))
-    logging.info("Saved {} nodes (made {} geolocation API calls, {} success, {} failures)".format(
-        len(result), geolocation_calls, geolocation_successes, geolocation_failures))
+    # until they have been missed too often and expire
+    with metrics.phase("worker", "save"):
+        changed = store.upsert_many(result)
+        # every node of the walk is stored now, the rest were preserved
+        preserved = store.count() - len(result)
+        stale, removed = store.sweep(
+            found,
+            stale_after=env_int("DISCOVERER_STALE_AFTER_SCANS", 3),
+            retention=env_int("DISCOVERER_STALE_RETENTION_DAYS", 30) * 86400
+        )
+        network.history.record(result)
+
+    with metrics.phase("worker", "publish"):
+        network.publish_snapshot()
+
+    with metrics.phase("worker", "graph"):
+        graph = PeerGraph.build(peers, found)
+        network.publish_graph(graph, [n for seed in seed_nodes for n in walk.neighbors.get(seed, ())])
+    logging.info("Saved {} {} nodes, {} changed, {} preserved, {} went stale, {} removed (looked up {} locations)".format(
+        len(result), network.name, changed, preserved, stale, removed, len(geo.looked_up)))
+    network.write_status("Idle", store.count(stale_at=None), scanning=False)
 
 
 def periodic_rescan():
-    """Periodically rescan info for all known nodes"""
-    while True:
-        time.sleep(300)  # Wait 5 minutes before first rescan
-        
-        logging.info("Starting periodic rescan of known nodes")
-        write_status("Periodic rescan", scanning=True)
-        known_nodes = load_known_nodes()
-        
-        if not known_nodes:
-            logging.info("No known nodes to rescan")
-            write_status("Idle", 0, scanning=False)
-            continue
-        
-        addresses = list(known_nodes.keys())
-        logging.info("Rescanning {} nodes concurrently with 10s timeout".format(len(addresses)))
-        
-        # Fetch info for all nodes concurrently
-        updated_info = rescan_nodes_info(addresses)
-        
-        # Update known nodes with new info
-        for address, info in updated_info.items():
-            if address in known_nodes:
-                known_nodes[address].update(info)
-                known_nodes[address]["last_seen"] = datetime.utcnow().isoformat()
-        
-        # Save updated data
-        save_path = os.path.join(this_dir, "..", "..", "..", "data.json")
-        result = list(known_nodes.values())
-        file_write(save_path, json.dumps(result))
-        logging.info("Periodic rescan completed, saved {} nodes".format(len(result)))
-        write_status("Idle", len(result), scanning=False)
+    """Keep rescanning known nodes, each on its own schedule"""
+    _run(_periodic_rescan)
+
+
+async def _periodic_rescan(prober: Prober):
+    await asyncio.gather(*[_rescan(prober, network) for network in get_networks()])
+
+
+async def _rescan(prober: Prober, network: Network):
+    scheduler = RescanScheduler.from_env()
+    store = network.store
+    logging.info("Starting adaptive rescan of known {} nodes, up to {} probes in flight".format(
+        network.name, scheduler.budget))
+
+    def load():
+        # private addresses never answer, the discovery walk records them; stale nodes rest
+        offline = set(store.addresses(connection_status="offline", stale_at=None))
+        return {a: "offline" if a in offline else None
+                for a in public_addresses(store.addresses(stale_at=None))}
+
+    # through the shards when there are any, where the walk keeps the circuit breakers of the nodes
+    shards = get_shards()
+    if shards is not None:
+        probe = partial(shards.probe_fields, port=network.api_port, p2p_port=network.p2p_port)
+    else:
+        probe = partial(_probe_fields, prober, port=network.api_port, p2p_port=network.p2p_port)
+
+    def flush(updates):
+        with metrics.phase("rescan", "flush"):
+            # every observation goes to the history; the store compares each one to the stored
+            # node, whoever wrote it last, and only writes changes and due last_seen refreshes
+            network.history.record(updates.values())
+            changed = store.update_many(updates)
+            if changed:
+                network.publish_snapshot()
+        logging.info("Rescanned {} {} nodes, {} changed, schedule: {}".format(
+            len(updates), network.name, changed, summarize(scheduler, time.time())))
+
+    await drain(scheduler, probe, load, flush)
 
 
 def rescan_only():
     """One-time rescan of all known nodes without network walking"""
-    logging.info("Starting one-time rescan of known nodes with geolocation refresh")
-    write_status("One-time rescan", scanning=True)
-    known_nodes = load_known_nodes()
+    preload_geo()
+    _run(_rescan_only)
+
+
+async def _rescan_only(prober: Prober):
+    await asyncio.gather(*[_rescan_known(prober, network) for network in get_networks()])
+
+
+async def _rescan_known(prober: Prober, network: Network):
+    logging.info("Starting one-time rescan of known {} nodes with geolocation refresh".format(network.name))
+    network.write_status("One-time rescan", scanning=True)
+    store = network.store
+    addresses = store.addresses(stale_at=None)
     
-    if not known_nodes:
-        logging.info("No known nodes to rescan")
-        write_status("Idle", 0, scanning=False)
+    if not addresses:
+        logging.info("No known {} nodes to rescan".format(network.name))
+        network.write_status("Idle", 0, scanning=False)
         return
     
-    addresses = list(known_nodes.keys())
     logging.info("Rescanning {} nodes concurrently with 10s timeout".format(len(addresses)))
     
     # Fetch info for all nodes concurrently
-    updated_info = rescan_nodes_info(addresses)
-    
-    # Update known nodes with new info and refresh geolocation
-    geoloc_log = os.path.join(this_dir, "..", "..", "..", "logs", "geolocation.log")
-    os.makedirs(os.path.dirname(geoloc_log), exist_ok=True)
-    geolocation_calls = 0
-    geolocation_successes = 0
-    geolocation_failures = 0
+    with metrics.phase("rescan_only", "probe"):
+        updated_info = await prober.get_nodes_info(addresses, network.api_port, network.p2p_port)
     
+    # Refresh geolocation through the geo cache
+    with metrics.phase("rescan_only", "geolocate"):
+        geo = await geolocate(prober, public_addresses(addresses))
+
+    # Update known nodes with new info and geolocation
+    now = datetime.utcnow().isoformat()
+    updates = {}
     for address in addresses:
-        if address in known_nodes:
-            # Update v2/info data
-            if address in updated_info:
-                known_nodes[address].update(updated_info[address])
-                known_nodes[address]["last_seen"] = datetime.utcnow().isoformat()
-            
-            # Refresh geolocation
-            if is_private_ip(address):
-                # Private IP - mark as Private IP
-                known_nodes[address]["location"] = {
-                    "lat": 0.0,
-                    "lng": 0.0,
-                    "country": "Private IP",
-                    "city": ""
-                }
-                logging.info("{} is a private IP address".format(address))
-            elif should_fetch_geolocation(known_nodes, address):
-                # Fetch fresh geolocation
-                location = ip_to_location(address)
-                geolocation_calls += 1
-                if location is not None:
-                    geolocation_successes += 1
-                    known_nodes[address]["location"] = {
-                        "lat": location["latitude"],
-                        "lng": location["longitude"],
-                        "country": location["country_name"] if location["country_name"] else "Unknown",
-                        "city": location["city"] if location["city"] else ""
-                    }
-                    known_nodes[address]["location_fetched_at"] = datetime.utcnow().isoformat()
-                    logging.info("✓ Fetched geolocation for {}: {}, {}".format(address, location["city"], location["country_name"]))
-                    with open(geoloc_log, "a") as f:
-                        f.write("{} | {} | SUCCESS | {}, {}\n".format(datetime.utcnow().isoformat(), address, location["city"], location["country_name"]))
-                else:
-                    geolocation_failures += 1
-                    known_nodes[address]["location"] = {
-                        "lat": 0.0,
-                        "lng": 0.0,
-                        "country": "Unknown",
-                        "city": ""
-                    }
-                    logging.warning("✗ Failed geolocation for {}".format(address))
-                    with open(geoloc_log, "a") as f:
-                        f.write("{} | {} | FAILURE\n".format(datetime.utcnow().isoformat(), address))
-    
-    # Save updated data
-    save_path = os.path.join(this_dir, "..", "..", "..", "data.json")
-    result = list(known_nodes.values())
-    file_write(save_path, json.dumps(result))
-    logging.info("One-time rescan completed, saved {} nodes (made {} geolocation calls, {} success, {} failures)".format(
-        len(result), geolocation_calls, geolocation_successes, geolocation_failures))
-    write_status("Idle", len(result), scanning=False)
+        info = updated_info[address]
+        record = NodeRecord(address)
+        record.apply_info(info, connection_status(info), now)
+
+        location = geo.locations.get(address)
+        if is_private_ip(address):
+            record.apply_location(PRIVATE_LOCATION)
+            logging.info("{} is a private IP address".format(address))
+        elif location is not None:
+            record.apply_location(Location.from_json(location), geo.fetched_at.get(address))
+        else:
+            record.apply_location(UNKNOWN_LOCATION)
+
+        updates[address] = record.to_json(NodeRecord.PROBED + NodeRecord.LOCATED)
+
+    # Save what changed
+    network.history.record(updates.values())
+    changed = store.update_many(updates)
+    if changed:
+        network.publish_snapshot()
+    logging.info("One-time rescan of {} completed, {} of {} nodes changed (looked up {} locations)".format(
+        network.name, changed, len(addresses), len(geo.looked_up)))
+    network.write_status("Idle", len(addresses), scanning=False)
+
+
+def geo_benchmark():
+    """Compare geolocation backends on the public addresses of every network's data.json"""
+    if os.environ.get("DISCOVERER_GEO_DB"):
+        get_offline_geo()
+    _run(_geo_benchmark)
+
+
+async def _geo_benchmark(prober: Prober):
+    ips = public_addresses(a for network in get_networks() for a in network.store.addresses())
+
+    if not ips:
+        logging.info("No known nodes to geolocate")
+        return
+
+    backends = [GeoJSBackend(prober)]
+    if os.environ.get("DISCOVERER_GEO_DB"):
+        backends.append(get_offline_geo())
+
+    for r in await benchmark(backends, ips):
+        agreement = "{:.0%}".format(r["agreement"]) if r["agreement"] is not None else "n/a"
+        logging.info("{}: located {}/{} in {:.3f}s ({:.1f}us per IP), country agreement {}".format(
+            r["backend"], r["located"], r["ips"], r["seconds"], r["us_per_ip"], agreement))
 
 
 def main():
-    import threading
-    
+    metrics.serve()
+    preload_geo()
+
     # Start periodic rescan in a background thread
     rescan_thread = threading.Thread(target=periodic_rescan, daemon=True)
     rescan_thread.start()
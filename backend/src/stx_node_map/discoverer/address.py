@@ -0,0 +1,125 @@
+import ipaddress
+import os
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# special-use ranges no reachable public node lives in (IANA special-purpose registries)
+BOGONS = (
+    # IPv4
+    "0.0.0.0/8",  # this network
+    "10.0.0.0/8",  # RFC 1918
+    "100.64.0.0/10",  # carrier-grade NAT
+    "127.0.0.0/8",  # loopback
+    "169.254.0.0/16",  # link-local
+    "172.16.0.0/12",  # RFC 1918
+    "192.0.0.0/24",  # IETF protocol assignments
+    "192.0.2.0/24",  # TEST-NET-1
+    "192.168.0.0/16",  # RFC 1918
+    "198.18.0.0/15",  # benchmarking
+    "198.51.100.0/24",  # TEST-NET-2
+    "203.0.113.0/24",  # TEST-NET-3
+    "224.0.0.0/4",  # multicast
+    "240.0.0.0/4",  # reserved, broadcast
+    # IPv6
+    "::/127",  # unspecified, loopback
+    "64:ff9b:1::/48",  # local-use NAT64
+    "100::/64",  # discard-only
+    "2001:db8::/32",  # documentation
+    "fc00::/7",  # unique local
+    "fe80::/10",  # link-local
+    "ff00::/8",  # multicast
+)
+
+# distinct addresses kept classified, above the default DISCOVERER_MAX_NODES with their neighbors
+CACHE_SIZE = 65536
+
+
+class CidrSet:
+    """CIDR blocks compiled to sorted, merged integer ranges per IP version"""
+
+    def __init__(self, cidrs: Iterable[str]):
+        ranges: Dict[int, List[Tuple[int, int]]] = {4: [], 6: []}
+        for cidr in cidrs:
+            network = ipaddress.ip_network(cidr.strip(), strict=False)
+            ranges[network.version].append((int(network.network_address), int(network.broadcast_address)))
+
+        self._starts: Dict[int, List[int]] = {}
+        self._ends: Dict[int, List[int]] = {}
+        for version, spans in ranges.items():
+            starts, ends = self._starts[version], self._ends[version] = [], []
+            for start, end in sorted(spans):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+
+    def __contains__(self, ip) -> bool:
+        n = int(ip)
+        i = bisect_right(self._starts[ip.version], n) - 1
+        return i >= 0 and n <= self._ends[ip.version][i]
+
+
+class AddressClassifier:
+    """Tells public node addresses from private, special-use and excluded ones
+
+    An address is public when it is a valid IPv4 or IPv6 address outside the
+    blocked ranges, or inside the allowed ranges, which take precedence (e.g.
+    to crawl a private test network). IPv4-mapped IPv6 addresses are
+    classified as the IPv4 address they carry; anything that doesn't parse,
+    hostnames included, is not public. Results are memoized per address.
+    """
+
+    def __init__(self, blocked: Iterable[str] = BOGONS, allowed: Iterable[str] = ()):
+        self.blocked = CidrSet(blocked)
+        self.allowed = CidrSet(allowed)
+        self.is_public = lru_cache(maxsize=CACHE_SIZE)(self._is_public)
+
+    @classmethod
+    def from_env(cls) -> "AddressClassifier":
+        """BOGONS plus DISCOVERER_BLOCKED_CIDRS, minus DISCOVERER_ALLOWED_CIDRS (comma-separated)"""
+        def cidrs(name):
+            return [c for c in os.environ.get(name, "").split(",") if c.strip()]
+
+        return cls(blocked=BOGONS + tuple(cidrs("DISCOVERER_BLOCKED_CIDRS")), allowed=cidrs("DISCOVERER_ALLOWED_CIDRS"))
+
+    def _is_public(self, address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+
+        return ip in self.allowed or ip not in self.blocked
+
+    def public(self, addresses: Iterable[str]) -> List[str]:
+        """The distinct public addresses of a list, in order"""
+        return [a for a in dict.fromkeys(addresses) if self.is_public(a)]
+
+
+classifier: Optional[AddressClassifier] = None
+classifier_lock = threading.Lock()
+
+
+def get_classifier() -> AddressClassifier:
+    """Classifier shared by every job of this process, configured from the environment"""
+    global classifier
+
+    with classifier_lock:
+        if classifier is None:
+            classifier = AddressClassifier.from_env()
+
+        return classifier
+
+
+def is_private_ip(address: str) -> bool:
+    """Not a public node address: private or special-use IP, excluded range or no IP at all"""
+    return not get_classifier().is_public(address)
+
+
+def public_addresses(addresses: Iterable[str]) -> List[str]:
+    return get_classifier().public(addresses)
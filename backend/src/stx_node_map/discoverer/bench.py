@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+# what each size runs, in order: a walk with empty stores, a walk with warm stores, a full rescan
+JOBS = ("worker_cold", "worker_warm", "rescan_only")
+
+VERSIONS = (
+    "stacks-node 3.1.0.0.7 (master:a1b2c3d, release build, linux [x86_64])",
+    "stacks-node 3.1.0.0.8 (master:d4e5f6a, release build, linux [x86_64])",
+    "stacks-node 3.2.0.0.0 (master:0a1b2c3, release build, linux [aarch64])",
+)
+
+
+class FakeNetwork:
+    """A simulated Stacks peer network
+
+    Nodes get public-looking addresses in 11.0.0.0/8 and `degree` random
+    neighbors each, plus a ring through all nodes so the walk can reach
+    every one of them from the first. A share of the nodes is dead (nothing
+    listens), p2p_only (only the P2P port is open) or hangs for `hang`
+    seconds before answering. Every answer is delayed by `latency` seconds.
+    The same seed always gives the same network.
+    """
+
+    def __init__(self, size: int, degree: int = 8, latency: float = 0.02, dead: float = 0.1,
+                 p2p_only: float = 0.05, hanging: float = 0.01, hang: float = 12.0, seed: int = 1):
+        rng = random.Random(seed)
+        self.latency = latency
+        self.hang = hang
+        self.addresses = ["11.{}.{}.{}".format(i >> 16 & 255, i >> 8 & 255, i & 255) for i in range(1, size + 1)]
+        self.kind: Dict[str, str] = {}
+        self.neighbors: Dict[str, List[str]] = {}
+        self.version: Dict[str, str] = {}
+
+        for i, address in enumerate(self.addresses):
+            roll = rng.random()
+            if i == 0 or roll >= dead + p2p_only + hanging:
+                self.kind[address] = "api"
+            elif roll < dead:
+                self.kind[address] = "dead"
+            elif roll < dead + p2p_only:
+                self.kind[address] = "p2p_only"
+            else:
+                self.kind[address] = "hanging"
+
+            ring = self.addresses[(i + 1) % size]
+            self.neighbors[address] = list({ring, *rng.sample(self.addresses, min(degree, size))} - {address})
+            self.version[address] = rng.choice(VERSIONS)
+
+        self.port = 0
+        self.p2p_port = 0
+        self.closed_port = _closed_port()
+
+    def core_api_url(self, host: str, endpoint: str, port: int) -> str:
+        port = self.port if self.kind.get(host) in ("api", "hanging") else self.closed_port
+        return "http://127.0.0.1:{}/{}/v2/{}".format(port, host, endpoint)
+
+    def tcp_address(self, host: str, port: int):
+        return "127.0.0.1", self.p2p_port if self.kind.get(host) == "p2p_only" else self.closed_port
+
+    @property
+    def geo_url(self) -> str:
+        return "http://127.0.0.1:{}/geo.json".format(self.port)
+
+    def configure(self, prober):
+        """Point a Prober at this network"""
+        prober.core_api_url = self.core_api_url
+        prober.geo_url = self.geo_url
+        prober.tcp_address = self.tcp_address
+        # every simulated node shares one server, don't let the pool serialize them
+        prober.pool_per_host = 0
+
+
+def _closed_port() -> int:
+    """A local port nothing listens on, connecting to it is refused right away"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class FakeNetworkServer:
+    """Serves a FakeNetwork and a stub GeoJS on 127.0.0.1 from a background thread"""
+
+    def __init__(self, network: FakeNetwork):
+        self.network = network
+        self.requests: Counter = Counter()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-network", daemon=True)
+        self._runner: Optional[web.AppRunner] = None
+        self._p2p: Optional[asyncio.AbstractServer] = None
+
+    async def _answer(self, host: str) -> bool:
+        kind = self.network.kind.get(host)
+        await asyncio.sleep(self.network.hang if kind == "hanging" else self.network.latency)
+        return kind in ("api", "hanging")
+
+    async def _neighbors(self, request: web.Request) -> web.Response:
+        self.requests["neighbors"] += 1
+        host = request.match_info["host"]
+        if not await self._answer(host):
+            return web.Response(status=404)
+
+        peers = [{"ip": a, "port": 20444} for a in self.network.neighbors[host]]
+        third = len(peers) // 3
+        return web.json_response({"sample": peers[:third], "inbound": peers[third:2 * third],
+                                  "outbound": peers[2 * third:]})
+
+    async def _info(self, request: web.Request) -> web.Response:
+        self.requests["info"] += 1
+        host = request.match_info["host"]
+        if not await self._answer(host):
+            return web.Response(status=404)
+
+        return web.json_response({"server_version": self.network.version[host], "burn_block_height": 900000,
+                                  "stackerdbs": []})
+
+    async def _geo(self, request: web.Request) -> web.Response:
+        self.requests["geo"] += 1
+        await asyncio.sleep(self.network.latency)
+
+        located = []
+        for ip in request.query.get("ip", "").split(","):
+            n = sum(int(p) for p in ip.split(".") if p.isdigit())
+            located.append({"ip": ip, "country": "Country {}".format(n % 40), "city": "City {}".format(n % 400),
+                            "latitude": str(n % 180 - 90), "longitude": str(n % 360 - 180)})
+
+        return web.json_response(located)
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get("/{host}/v2/neighbors", self._neighbors)
+        app.router.add_get("/{host}/v2/info", self._info)
+        app.router.add_get("/geo.json", self._geo)
+
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.network.port = sock.getsockname()[1]
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.SockSite(self._runner, sock, backlog=4096).start()
+
+        async def accept(reader, writer):
+            self.requests["p2p"] += 1
+            writer.close()
+
+        self._p2p = await asyncio.start_server(accept, "127.0.0.1", 0)
+        self.network.p2p_port = self._p2p.sockets[0].getsockname()[1]
+
+    async def _stop(self):
+        self._p2p.close()
+        await self._runner.cleanup()
+
+    def __enter__(self) -> "FakeNetworkServer":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def _measure(network: FakeNetwork, concurrency: int, shards: int, verbose: bool, results):
+    """Run the benchmarked jobs in this (fresh) process against the simulated network"""
+    import stx_node_map.discoverer as discoverer
+    from stx_node_map.discoverer.probe import Prober
+
+    if not verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    discoverer.data_dir = tempfile.mkdtemp(prefix="stx-bench-")
+    os.environ.update({
+        "NETWORKS": "bench",
+        "DISCOVERER_SEED_NODES": network.addresses[0],
+        "DISCOVERER_MAX_DEPTH": "1000",
+        "DISCOVERER_MAX_NODES": str(len(network.addresses) * 2),
+        "DISCOVERER_GEO_BACKEND": "geojs",
+        "DISCOVERER_CONCURRENCY": str(concurrency),
+        "DISCOVERER_SHARDS": str(shards),
+    })
+    discoverer.shard_setup = network.configure
+
+    async def run():
+        prober = Prober(concurrency=concurrency)
+        network.configure(prober)
+
+        async with prober:
+            for job in JOBS:
+                requests = prober.stats["requests"]
+                started = time.perf_counter()
+                await (discoverer._rescan_only if job == "rescan_only" else discoverer._worker)(prober)
+                results.put({
+                    "job": job,
+                    "seconds": round(time.perf_counter() - started, 3),
+                    "http_requests": prober.stats["requests"] - requests,
+                    "nodes": discoverer.get_networks()[0].store.count()
+                })
+
+    try:
+        asyncio.run(run())
+    finally:
+        if discoverer.shard_pool is not None:
+            discoverer.shard_pool.close()
+        shutil.rmtree(discoverer.data_dir, ignore_errors=True)
+
+    # ru_maxrss is in kilobytes on Linux
+    results.put({"peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)})
+
+
+def run_size(size: int, args) -> List[dict]:
+    network = FakeNetwork(size, degree=args.degree, latency=args.latency, dead=args.dead, p2p_only=args.p2p_only,
+                          hanging=args.hanging, hang=args.hang, seed=args.seed)
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+
+    rows = []
+
+    with FakeNetworkServer(network) as server:
+        child = context.Process(target=_measure, args=(network, args.concurrency, args.shards, args.verbose, results))
+        child.start()
+
+        # drain the queue before joining, a child can't exit while its queue is unread
+        while len(rows) < len(JOBS) + 1:
+            try:
+                rows.append(results.get(timeout=1))
+            except queue.Empty:
+                if not child.is_alive():
+                    break
+
+        child.join()
+
+    if child.exitcode != 0 or len(rows) < len(JOBS) + 1:
+        raise RuntimeError("Benchmark of {} nodes failed".format(size))
+
+    peak = rows.pop()["peak_rss_mb"]
+    for row in rows:
+        row.update(size=size, peak_rss_mb=peak, server_requests=dict(server.requests))
+    return rows
+
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """Jobs that got more than `tolerance` slower than in the baseline"""
+    before = {(r["size"], r["job"]): r["seconds"] for r in baseline}
+    slower = []
+
+    for r in results:
+        previous = before.get((r["size"], r["job"]))
+        if previous and r["seconds"] > previous * (1 + tolerance):
+            slower.append("{} at {} nodes: {:.2f}s, was {:.2f}s".format(r["job"], r["size"], r["seconds"], previous))
+
+    return slower
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the discoverer against a simulated peer network")
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma-separated network sizes")
+    parser.add_argument("--degree", type=int, default=8, help="random neighbors per node")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds every answer is delayed")
+    parser.add_argument("--dead", type=float, default=0.1, help="share of nodes nothing listens on")
+    parser.add_argument("--p2p-only", type=float, default=0.05, help="share of nodes with only the P2P port open")
+    parser.add_argument("--hanging", type=float, default=0.01, help="share of nodes answering after --hang seconds")
+    parser.add_argument("--hang", type=float, default=12.0, help="seconds hanging nodes take to answer")
+    parser.add_argument("--concurrency", type=int, default=256, help="probes in flight")
+    parser.add_argument("--shards", type=int, default=1, help="discovery shard processes, see DISCOVERER_SHARDS")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="keep the discoverer's own logging")
+    args = parser.parse_args(argv)
+
+    results = []
+    print("{:>7} {:<12} {:>9} {:>9} {:>7} {:>9}".format("nodes", "job", "seconds", "requests", "found", "peak MB"))
+    for size in [int(s) for s in args.sizes.split(",")]:
+        for row in run_size(size, args):
+            results.append(row)
+            print("{size:>7} {job:<12} {seconds:>9.2f} {http_requests:>9} {nodes:>7} {peak_rss_mb:>9}".format(**row))
+
+        print("{:>7} served {}".format("", ", ".join("{} {}".format(k, v) for k, v in sorted(row["server_requests"].items()))))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare(results, json.load(f), args.tolerance)
+
+        for line in slower:
+            logging.error("Regression: {}".format(line))
+
+        if slower:
+            sys.exit(1)
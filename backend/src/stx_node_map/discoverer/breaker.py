@@ -0,0 +1,90 @@
+import time
+from typing import Dict, Hashable, Optional
+
+from stx_node_map.util import env_int
+
+
+class _Circuit:
+    __slots__ = ("failures", "open_until", "trial")
+
+    def __init__(self):
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial = False
+
+
+class HostBreakers:
+    """Per-node circuit breakers, so nodes known to be dead cost next to nothing
+
+    Nodes are keyed by whatever identifies them to the caller, the Prober
+    uses (host, API port) since one host may run nodes of several networks.
+    After `failures` probes in a row found a node completely unreachable its
+    circuit opens: probes of it fail right away without touching the
+    network. Once `cooldown` seconds have passed the circuit is half-open
+    and lets a single trial probe through; if that fails too the circuit
+    opens again for twice as long, up to `max_cooldown`. Any answer closes
+    the circuit. Only nodes that failed are tracked.
+    """
+
+    def __init__(self, failures: int = 3, cooldown: int = 300, max_cooldown: int = 3600):
+        self.failures = max(1, failures)
+        self.cooldown = cooldown
+        self.max_cooldown = max(cooldown, max_cooldown)
+        self._nodes: Dict[Hashable, _Circuit] = {}
+        # circuits at or above the failure threshold, kept as a count since metric
+        # scrapes read it from another thread while the probe loop changes _nodes
+        self._open = 0
+
+    @classmethod
+    def from_env(cls) -> "HostBreakers":
+        return cls(
+            failures=env_int("DISCOVERER_BREAKER_FAILURES", 3),
+            cooldown=env_int("DISCOVERER_BREAKER_COOLDOWN", 300),
+            max_cooldown=env_int("DISCOVERER_BREAKER_MAX_COOLDOWN", 3600)
+        )
+
+    def is_open(self, node: Hashable, now: Optional[float] = None) -> bool:
+        """Whether probes of node should fail fast, without claiming the half-open trial"""
+        circuit = self._nodes.get(node)
+        if circuit is None or circuit.failures < self.failures:
+            return False
+
+        return circuit.trial or (now if now is not None else time.time()) < circuit.open_until
+
+    def allow(self, node: Hashable, now: Optional[float] = None) -> bool:
+        """Whether node may be probed; a half-open circuit lets this one caller through as its trial"""
+        if self.is_open(node, now):
+            return False
+
+        circuit = self._nodes.get(node)
+        if circuit is not None and circuit.failures >= self.failures:
+            circuit.trial = True
+
+        return True
+
+    def success(self, node: Hashable):
+        circuit = self._nodes.pop(node, None)
+        if circuit is not None and circuit.failures >= self.failures:
+            self._open -= 1
+
+    def failure(self, node: Hashable, now: Optional[float] = None):
+        circuit = self._nodes.get(node)
+        if circuit is None:
+            circuit = self._nodes[node] = _Circuit()
+
+        circuit.failures += 1
+        circuit.trial = False
+        if circuit.failures == self.failures:
+            self._open += 1
+        if circuit.failures >= self.failures:
+            backoff = self.cooldown * 2 ** min(circuit.failures - self.failures, 16)
+            circuit.open_until = (now if now is not None else time.time()) + min(backoff, self.max_cooldown)
+
+    def release(self, node: Hashable):
+        """Give up a trial that ended without an outcome, e.g. because it was cancelled"""
+        circuit = self._nodes.get(node)
+        if circuit is not None:
+            circuit.trial = False
+
+    def open_count(self) -> int:
+        return self._open
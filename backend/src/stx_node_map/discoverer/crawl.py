@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List
+
+from stx_node_map.discoverer import metrics
+
+
+class CrawlResult:
+    """Outcome of a breadth-first walk of the peer network
+
+    - found: every public address discovered, in discovery order
+    - neighbors: neighbor lists of the addresses that were queried
+    - depth: number of hops that were actually expanded
+    """
+
+    def __init__(self):
+        self.found: List[str] = []
+        self.neighbors: Dict[str, List[str]] = {}
+        self.depth = 0
+
+
+async def crawl(seeds: Iterable[str], fetch_neighbors: Callable[[str], Awaitable[List[str]]],
+                max_depth: int = 4, max_nodes: int = 10000, network: str = "") -> CrawlResult:
+    """Walk the network breadth-first starting from the seed hosts
+
+    Each hop queries the whole frontier concurrently (bounded by the limits of
+    whatever fetch_neighbors runs on), so a walk costs roughly
+    max_depth x request timeout. Addresses are only ever queried once, and the
+    walk stops early when a hop yields no new addresses or max_nodes is reached.
+    Its progress is reported in the crawl metrics labelled with `network`.
+    """
+    result = CrawlResult()
+    seen = set()
+    frontier = []
+
+    for seed in seeds:
+        if seed not in seen:
+            seen.add(seed)
+            frontier.append(seed)
+
+    discovered = set()
+
+    while frontier and result.depth < max_depth:
+        result.depth += 1
+        metrics.CRAWL_DEPTH.labels(network).set(result.depth)
+        metrics.CRAWL_FRONTIER.labels(network).set(len(frontier))
+        logging.info("Crawl{} depth {}: querying {} nodes".format(" of " + network if network else "", result.depth,
+                                                                  len(frontier)))
+
+        next_frontier = []
+        hop = await asyncio.gather(*[fetch_neighbors(a) for a in frontier])
+        for address, neighbors in zip(frontier, hop):
+            result.neighbors[address] = neighbors
+
+            for n in neighbors:
+                if n in discovered or len(discovered) >= max_nodes:
+                    continue
+
+                discovered.add(n)
+                result.found.append(n)
+
+                if n not in seen:
+                    seen.add(n)
+                    next_frontier.append(n)
+
+        metrics.CRAWL_FOUND.labels(network).set(len(result.found))
+
+        if len(discovered) >= max_nodes:
+            logging.info("Crawl stopped at max nodes ({})".format(max_nodes))
+            break
+
+        frontier = next_frontier
+
+    logging.info("Crawl finished after {} hops: {} nodes found, {} queried".format(
+        result.depth, len(result.found), len(result.neighbors)))
+
+    return result
@@ -0,0 +1,314 @@
+import abc
+import asyncio
+import csv
+import json
+import logging
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from stx_node_map.discoverer.probe import parse_location
+from stx_node_map.util import env_int
+
+
+class GeoBackend(abc.ABC):
+    """Resolves IP addresses to locations in the format of parse_location"""
+
+    name = ""
+
+    # whether results are worth keeping in the GeoCache
+    cacheable = True
+
+    @abc.abstractmethod
+    async def lookup(self, ips: List[str]) -> Dict[str, Optional[dict]]:
+        """Location of every IP, None for those the backend doesn't know"""
+
+
+class GeoJSBackend(GeoBackend):
+    """Batched lookups against the GeoJS.io web service"""
+
+    name = "geojs"
+
+    def __init__(self, prober):
+        self.prober = prober
+
+    async def lookup(self, ips: List[str]) -> Dict[str, Optional[dict]]:
+        return await self.prober.ip_to_locations(ips)
+
+
+def ipv4_to_int(ip: str) -> int:
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+class OfflineBackend(GeoBackend):
+    """Lookups against a local IPv4 range database, no network involved
+
+    Loads a city-level CSV range file in the layout of IP2Location LITE DB5:
+
+        start, end, country code, country, region, city, latitude, longitude
+
+    Ranges may be integers or dotted IPv4 addresses, IPv6 rows are skipped.
+    Files with country codes where the country names belong, like DB-IP
+    City Lite (continent, country code), are refused, their codes would
+    mix with the names GeoJS reports. Ranges are kept as sorted uint32
+    arrays and found by binary search over the range starts.
+    """
+
+    name = "offline"
+    cacheable = False
+
+    def __init__(self, path: str):
+        self.starts = array("I")
+        self.ends = array("I")
+        self.rows = array("I")
+        self.locations: List[Optional[dict]] = []
+
+        started = time.time()
+        self._load(path)
+        logging.info("Loaded {} IP ranges ({} distinct locations) from {} in {:.1f}s".format(
+            len(self.starts), len(self.locations), path, time.time() - started))
+
+    def _load(self, path: str):
+        location_ids = {}
+
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if len(row) < 8 or ":" in row[0]:
+                    continue
+
+                try:
+                    start = int(row[0]) if row[0].isdigit() else ipv4_to_int(row[0])
+                    end = int(row[1]) if row[1].isdigit() else ipv4_to_int(row[1])
+                except (OSError, ValueError):
+                    continue  # header or malformed line
+
+                if len(row[3]) == 2 and row[3].isupper():
+                    raise AssertionError("{} has country codes instead of names, expected the IP2Location DB5 "
+                                         "layout".format(path))
+
+                key = (row[3], row[5], row[6], row[7])
+                location_id = location_ids.get(key)
+                if location_id is None:
+                    location_id = location_ids[key] = len(self.locations)
+                    country, city, latitude, longitude = ("" if v == "-" else v for v in key)
+                    self.locations.append(parse_location({
+                        "country": country, "city": city, "latitude": latitude, "longitude": longitude
+                    }))
+
+                self.starts.append(start)
+                self.ends.append(end)
+                self.rows.append(location_id)
+
+        if any(self.starts[i] > self.starts[i + 1] for i in range(len(self.starts) - 1)):
+            order = sorted(range(len(self.starts)), key=self.starts.__getitem__)
+            self.starts = array("I", (self.starts[i] for i in order))
+            self.ends = array("I", (self.ends[i] for i in order))
+            self.rows = array("I", (self.rows[i] for i in order))
+
+    def lookup_ip(self, ip: str) -> Optional[dict]:
+        try:
+            n = ipv4_to_int(ip)
+        except OSError:
+            return None
+
+        i = bisect_right(self.starts, n) - 1
+        if i < 0 or n > self.ends[i]:
+            return None
+
+        return self.locations[self.rows[i]]
+
+    async def lookup(self, ips: List[str]) -> Dict[str, Optional[dict]]:
+        return {ip: self.lookup_ip(ip) for ip in ips}
+
+
+class GeoCache:
+    """Persistent geolocation cache keyed by IP address
+
+    Successful lookups are kept for `ttl` seconds, failed ones (stored as a
+    NULL location) for `negative_ttl` so dead lookups aren't retried every
+    scan. Once more than `max_entries` rows exist, the least recently used
+    ones are evicted. Safe to share between threads.
+    """
+
+    def __init__(self, path: str, ttl: int = 30 * 86400, negative_ttl: int = 86400, max_entries: int = 100000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geo ("
+            "ip TEXT PRIMARY KEY, location TEXT, fetched_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS geo_used_at ON geo (used_at)")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls, path: str) -> "GeoCache":
+        return cls(
+            path,
+            ttl=env_int("DISCOVERER_GEO_TTL_DAYS", 30) * 86400,
+            negative_ttl=env_int("DISCOVERER_GEO_NEGATIVE_TTL_HOURS", 24) * 3600,
+            max_entries=env_int("DISCOVERER_GEO_CACHE_SIZE", 100000)
+        )
+
+    def get_many(self, ips: Iterable[str]) -> Dict[str, Tuple[Optional[dict], float]]:
+        """Return fresh entries as ip -> (location or None, fetched_at), missing and expired IPs are left out"""
+        ips = list(ips)
+        now = time.time()
+        found = {}
+
+        with self._lock:
+            for i in range(0, len(ips), 500):
+                chunk = ips[i:i + 500]
+                rows = self._conn.execute(
+                    "SELECT ip, location, fetched_at FROM geo WHERE ip IN ({})".format(",".join("?" * len(chunk))),
+                    chunk
+                ).fetchall()
+
+                for ip, location, fetched_at in rows:
+                    ttl = self.ttl if location is not None else self.negative_ttl
+                    if now - fetched_at < ttl:
+                        found[ip] = (json.loads(location) if location is not None else None, fetched_at)
+
+            self._conn.executemany("UPDATE geo SET used_at = ? WHERE ip = ?", [(now, ip) for ip in found])
+            self._conn.commit()
+
+        return found
+
+    def put_many(self, locations: Dict[str, Optional[dict]], now: Optional[float] = None):
+        """Store lookup results, None marks a failed lookup"""
+        now = now if now is not None else time.time()
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO geo (ip, location, fetched_at, used_at) VALUES (?, ?, ?, ?)",
+                [(ip, json.dumps(loc) if loc is not None else None, now, now) for ip, loc in locations.items()]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM geo").fetchone()[0]
+        if count <= self.max_entries:
+            return
+
+        self._conn.execute(
+            "DELETE FROM geo WHERE ip IN (SELECT ip FROM geo ORDER BY used_at LIMIT ?)",
+            (count - self.max_entries,)
+        )
+        logging.info("Evicted {} geolocation cache entries".format(count - self.max_entries))
+
+
+class GeoResult:
+    """Outcome of resolving a batch of IPs
+
+    - locations: every requested IP mapped to a location dict or None
+    - fetched_at: unix time each known location was looked up, for cacheable backends
+    - looked_up: the subset that missed the cache and went to the network
+    """
+
+    def __init__(self):
+        self.locations: Dict[str, Optional[dict]] = {}
+        self.fetched_at: Dict[str, float] = {}
+        self.looked_up: Dict[str, Optional[dict]] = {}
+
+
+async def locate(backend: GeoBackend, cache: GeoCache, ips: List[str],
+                 pending: Optional[Dict[str, asyncio.Future]] = None) -> GeoResult:
+    """Resolve locations through the cache, handing only the misses to the backend
+
+    Concurrent calls sharing a `pending` dict (IP -> lookup in progress)
+    wait for each other's lookups instead of repeating them, so networks
+    walked side by side look up the IPs they have in common once.
+
+    Backends that aren't cacheable answer from local data: their results
+    are neither reported as lookups nor given a fetched_at, which would
+    otherwise change on every call and make every node look relocated.
+    """
+    result = GeoResult()
+    if not backend.cacheable:
+        result.locations = await backend.lookup(ips)
+        return result
+
+    cached = cache.get_many(ips)
+    misses = [ip for ip in ips if ip not in cached]
+    pending = {} if pending is None else pending
+    joined = {ip: pending[ip] for ip in misses if ip in pending}
+    misses = [ip for ip in misses if ip not in joined]
+    now = time.time()
+
+    if misses:
+        lookup = asyncio.ensure_future(backend.lookup(misses))
+        for ip in misses:
+            pending[ip] = lookup
+
+        try:
+            result.looked_up = await lookup
+        finally:
+            for ip in misses:
+                if pending.get(ip) is lookup:
+                    del pending[ip]
+
+        now = time.time()
+
+        # same fetched_at as reported, so later cache hits don't look like a new location
+        cache.put_many(result.looked_up, now)
+
+    shared: Dict[str, Optional[dict]] = {}
+    for lookup in set(joined.values()):
+        # shielded, the lookup belongs to another call
+        shared.update(await asyncio.shield(lookup))
+
+    if joined:
+        # with the fetched_at the other call stored
+        cached.update(cache.get_many(list(joined)))
+
+    for ip in ips:
+        if ip in cached:
+            location, fetched_at = cached[ip]
+        else:
+            location, fetched_at = result.looked_up[ip] if ip in result.looked_up else shared.get(ip), now
+        result.locations[ip] = location
+
+        if location is not None:
+            result.fetched_at[ip] = fetched_at
+
+    return result
+
+
+async def benchmark(backends: List[GeoBackend], ips: List[str]) -> List[dict]:
+    """Time each backend resolving the same IPs, bypassing the cache
+
+    Agreement is the share of IPs the backend places in the same country as
+    the first backend, counting only IPs both could locate.
+    """
+    results = []
+    reference = None
+
+    for backend in backends:
+        started = time.perf_counter()
+        located = await backend.lookup(ips)
+        elapsed = time.perf_counter() - started
+
+        if reference is None:
+            reference = located
+
+        both = [ip for ip in ips if located.get(ip) and reference.get(ip)]
+        same = [ip for ip in both if located[ip]["country_name"] == reference[ip]["country_name"]]
+
+        results.append({
+            "backend": backend.name,
+            "ips": len(ips),
+            "located": sum(1 for ip in ips if located.get(ip)),
+            "seconds": elapsed,
+            "us_per_ip": elapsed / len(ips) * 1e6 if ips else 0.0,
+            "agreement": len(same) / len(both) if both else None
+        })
+
+    return results
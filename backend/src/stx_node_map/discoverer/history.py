@@ -0,0 +1,179 @@
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from stx_node_map.util import env_int
+from stx_node_map.util.series import CHUNK_SECONDS, RAW_SAMPLE, SCHEMA, STATUS_CODES, decode_chunk, downsample, \
+    encode_chunk
+
+# resolution, in seconds, chunks are downsampled to once they are older than raw_days
+DOWNSAMPLED_RESOLUTION = 3600
+
+# seconds between compaction passes
+MAINTENANCE_INTERVAL = 3600
+
+# nodes compacted, or chunks downsampled, per maintenance transaction
+MAINTENANCE_BATCH = 256
+
+
+class HistoryStore:
+    """Time series of node observations: connection status, burn block height, version
+
+    Observations of the current day are plain rows, cheap to append; an
+    observation identical to the node's previous one in the same hour only
+    bumps that row's count. Once a day is over they are compacted into one
+    column-encoded chunk per node and day (see stx_node_map.util.series).
+    Chunks older than `raw_days` are downsampled to hourly samples and chunks
+    older than `retention_days` are dropped, so the store grows with the
+    number of nodes, not with time.
+
+    Maintenance runs in a background thread on its own connection and
+    commits in small batches, so the jobs recording observations, which run
+    on the probe loop, never wait for more than one batch.
+    """
+
+    def __init__(self, path: str, raw_days: int = 7, retention_days: int = 90):
+        self.path = path
+        self.raw_days = raw_days
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+        self._versions: Dict[str, int] = dict(self._conn.execute("SELECT version, id FROM versions"))
+        # address -> (rowid, hour, observed state) of the node's last observation row
+        self._last: Dict[str, Tuple[int, int, tuple]] = {}
+        self._maintained_at = 0.0
+        self._maintenance = threading.Lock()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(observations)")}
+
+        if "n" not in columns:
+            # identical observations merged into the row
+            self._conn.execute("ALTER TABLE observations ADD COLUMN n INTEGER NOT NULL DEFAULT 1")
+
+    @classmethod
+    def from_env(cls, path: str) -> "HistoryStore":
+        return cls(
+            path,
+            raw_days=env_int("DISCOVERER_HISTORY_RAW_DAYS", 7),
+            retention_days=env_int("DISCOVERER_HISTORY_RETENTION_DAYS", 90)
+        )
+
+    def _version_id(self, version: Optional[str]) -> int:
+        if not version:
+            return 0
+
+        version_id = self._versions.get(version)
+        if version_id is None:
+            cursor = self._conn.execute("INSERT INTO versions (version) VALUES (?)", (version,))
+            version_id = self._versions[version] = cursor.lastrowid
+
+        return version_id
+
+    def record(self, nodes: Iterable[dict], now: Optional[float] = None):
+        """Append one observation per node document"""
+        now = now if now is not None else time.time()
+        t = int(now)
+        hour = t - t % DOWNSAMPLED_RESOLUTION
+
+        with self._lock:
+            repeated = []
+            for node in nodes:
+                address = node["address"]
+                state = (
+                    STATUS_CODES.get(node.get("connection_status"), 0),
+                    node.get("burn_block_height") or 0,
+                    self._version_id((node.get("version") or {}).get("version"))
+                )
+
+                last = self._last.get(address)
+                if last is not None and last[1] == hour and last[2] == state:
+                    repeated.append((t, last[0]))
+                    continue
+
+                cursor = self._conn.execute(
+                    "INSERT INTO observations (address, t, status, height, version) VALUES (?, ?, ?, ?, ?)",
+                    (address, t) + state
+                )
+                self._last[address] = (cursor.lastrowid, hour, state)
+
+            self._conn.executemany("UPDATE observations SET t = ?, n = n + 1 WHERE rowid = ?", repeated)
+            self._conn.commit()
+
+        if now - self._maintained_at >= MAINTENANCE_INTERVAL and self._maintenance.acquire(blocking=False):
+            self._maintained_at = now
+            threading.Thread(target=self._maintain_in_background, args=(now,), name="history-maintenance",
+                             daemon=True).start()
+
+    def _maintain_in_background(self, now: float):
+        try:
+            self.maintain(now)
+        except sqlite3.Error as e:
+            logging.warning("History maintenance failed: {}".format(e))
+        finally:
+            self._maintenance.release()
+
+    def maintain(self, now: float):
+        """Compact closed days, downsample old chunks and drop expired ones"""
+        today = int(now) - int(now) % CHUNK_SECONDS
+        downsample_before = today - self.raw_days * CHUNK_SECONDS
+        expire_before = today - self.retention_days * CHUNK_SECONDS
+        started = time.time()
+
+        with closing(sqlite3.connect(self.path, timeout=30.0)) as conn:
+            addresses = [r[0] for r in conn.execute(
+                "SELECT DISTINCT address FROM observations WHERE t < ? ORDER BY address", (today,)
+            )]
+            compacted = 0
+            for batch in self._batches(addresses):
+                rows = conn.execute(
+                    "SELECT " + RAW_SAMPLE + " FROM observations WHERE address BETWEEN ? AND ? AND t < ? "
+                    "ORDER BY address, t", (batch[0], batch[-1], today)
+                ).fetchall()
+                for (address, start), group in groupby(rows, key=lambda r: (r[0], r[1] - r[1] % CHUNK_SECONDS)):
+                    self._put_chunk(conn, address, start, 0, [r[1:] for r in group])
+                    compacted += 1
+                conn.execute("DELETE FROM observations WHERE address BETWEEN ? AND ? AND t < ?",
+                             (batch[0], batch[-1], today))
+                conn.commit()
+
+            old = conn.execute(
+                "SELECT address, start FROM chunks WHERE resolution = 0 AND start < ? ORDER BY address, start",
+                (downsample_before,)
+            ).fetchall()
+            for batch in self._batches(old):
+                for address, start in batch:
+                    columns = conn.execute(
+                        "SELECT times, up, total, heights, versions FROM chunks WHERE address = ? AND start = ?",
+                        (address, start)
+                    ).fetchone()
+                    samples = downsample(decode_chunk(start, *columns), DOWNSAMPLED_RESOLUTION)
+                    self._put_chunk(conn, address, start, DOWNSAMPLED_RESOLUTION, samples)
+                conn.commit()
+
+            expired = conn.execute("DELETE FROM chunks WHERE start < ?", (expire_before,)).rowcount
+            conn.commit()
+
+        if compacted or old or expired:
+            logging.info("History maintenance: compacted {} node days, downsampled {}, expired {} in {:.1f}s".format(
+                compacted, len(old), expired, time.time() - started))
+
+    @staticmethod
+    def _batches(items: List) -> Iterable[List]:
+        return (items[i:i + MAINTENANCE_BATCH] for i in range(0, len(items), MAINTENANCE_BATCH))
+
+    @staticmethod
+    def _put_chunk(conn: sqlite3.Connection, address: str, start: int, resolution: int, samples):
+        conn.execute(
+            "INSERT OR REPLACE INTO chunks (address, start, resolution, times, up, total, heights, versions) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (address, start, resolution) + encode_chunk(start, samples)
+        )
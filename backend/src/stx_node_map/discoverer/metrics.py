@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import aiohttp
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from stx_node_map.util import env_int
+
+PROBE_SECONDS = Histogram(
+    "stx_discoverer_probe_seconds", "Duration of network probes, including waiting for a slot", ["probe"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15)
+)
+PROBE_FAILURES = Counter(
+    "stx_discoverer_probe_failures_total", "Probes that got no usable answer", ["probe", "reason"]
+)
+PROBES_IN_FLIGHT = Gauge("stx_discoverer_probes_in_flight", "Probes started and not finished yet", ["probe"])
+SLOT_WAIT_SECONDS = Histogram(
+    "stx_discoverer_slot_wait_seconds", "Time probes waited for a per-host and a global concurrency slot",
+    buckets=(0.001, 0.01, 0.1, 0.5, 1, 2, 5, 10, 30)
+)
+CIRCUITS_OPEN = Gauge("stx_discoverer_circuits_open", "Hosts probes currently skip because they stopped answering")
+HTTP_REQUESTS = Counter("stx_discoverer_http_requests_total", "HTTP requests sent")
+HTTP_CONNECTIONS = Counter("stx_discoverer_http_connections_total", "HTTP connections used", ["origin"])
+
+CRAWL_DEPTH = Gauge("stx_discoverer_crawl_depth", "Hops expanded by the running or last discovery walk", ["network"])
+CRAWL_FRONTIER = Gauge("stx_discoverer_crawl_frontier_size", "Addresses queried in the current hop of the walk",
+                       ["network"])
+CRAWL_FOUND = Gauge("stx_discoverer_crawl_found", "Addresses found so far by the running or last walk", ["network"])
+
+PHASE_SECONDS = Histogram(
+    "stx_discoverer_phase_seconds", "Wall time of the phases of discoverer jobs", ["job", "phase"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600)
+)
+SNAPSHOT_WRITE_SECONDS = Histogram(
+    "stx_discoverer_snapshot_write_seconds", "Time to write data.json and stats.json",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+)
+
+# port serve() exposes the metrics on, 0 while they aren't served
+served_port = 0
+
+
+@contextmanager
+def probe(name: str):
+    """Time a probe and count how it failed if it raises"""
+    PROBES_IN_FLIGHT.labels(name).inc()
+    started = time.perf_counter()
+
+    try:
+        yield
+    except asyncio.TimeoutError:
+        failure(name, "timeout")
+        raise
+    except (aiohttp.ClientError, OSError):
+        failure(name, "connection")
+        raise
+    except ValueError:
+        failure(name, "invalid_response")
+        raise
+    finally:
+        PROBES_IN_FLIGHT.labels(name).dec()
+        PROBE_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+def failure(name: str, reason: str):
+    PROBE_FAILURES.labels(name, reason).inc()
+
+
+@contextmanager
+def phase(job: str, name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_SECONDS.labels(job, name).observe(time.perf_counter() - started)
+
+
+def serve(port: Optional[int] = None):
+    """Expose the metrics on http://127.0.0.1:DISCOVERER_METRICS_PORT/metrics, 0 disables it
+
+    Discovery shards probe in their own processes with their own metrics,
+    shard i serves them on the port after the coordinator's plus i.
+    """
+    global served_port
+    port = env_int("DISCOVERER_METRICS_PORT", 9108) if port is None else port
+    if port:
+        start_http_server(port, addr="127.0.0.1")
+        served_port = port
+        logging.info("Serving metrics on 127.0.0.1:{}".format(port))
@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from stx_node_map.discoverer import metrics
+from stx_node_map.discoverer.history import HistoryStore
+from stx_node_map.discoverer.stats import compute_stats
+from stx_node_map.discoverer.store import NodeStore
+from stx_node_map.util import assert_env_vars, env_int, file_write_atomic
+from stx_node_map.util.graph import PeerGraph
+from stx_node_map.util.network import env_suffix, network_dir, network_names
+
+
+class Network:
+    """One Stacks network the discoverer maps, with its own seeds, ports and data files
+
+    Every network has its node store, history, data.json, stats.json,
+    status.json and graph.json in its directory; probes, the probe loop
+    and the geolocation cache are shared by all networks of the process.
+    """
+
+    def __init__(self, name: str, seeds: List[str], directory: str, api_port: int = 20443, p2p_port: int = 20444):
+        self.name = name
+        self.seeds = seeds
+        self.directory = directory
+        self.api_port = api_port
+        self.p2p_port = p2p_port
+        self._store: Optional[NodeStore] = None
+        self._history: Optional[HistoryStore] = None
+        self._lock = threading.Lock()
+        # (status, scanning, nodes_count) last written, only transitions become events
+        self._last_status: Optional[tuple] = None
+
+    @classmethod
+    def from_env(cls, name: str, directory: str, primary: bool = False) -> "Network":
+        """Settings from the variables suffixed with the network's name, e.g. DISCOVERER_SEED_NODES_TESTNET
+
+        The primary network falls back to the unsuffixed DISCOVERER_SEED_NODES.
+        """
+        suffix = env_suffix(name)
+        seeds = os.environ.get("DISCOVERER_SEED_NODES_{}".format(suffix))
+        if seeds is None:
+            seeds = assert_env_vars("DISCOVERER_SEED_NODES" if primary else "DISCOVERER_SEED_NODES_{}".format(suffix))
+
+        return cls(
+            name,
+            [n.strip() for n in seeds.split(",") if n.strip()],
+            directory,
+            api_port=env_int("DISCOVERER_API_PORT_{}".format(suffix), 20443),
+            p2p_port=env_int("DISCOVERER_P2P_PORT_{}".format(suffix), 20444)
+        )
+
+    def path(self, name: str) -> str:
+        """Path of a data file of this network"""
+        return os.path.join(self.directory, name)
+
+    @property
+    def store(self) -> NodeStore:
+        """Node store of this network, seeded from its data.json on first use"""
+        with self._lock:
+            if self._store is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._store = NodeStore(self.path("nodes.db"),
+                                        last_seen_resolution=env_int("DISCOVERER_LAST_SEEN_RESOLUTION", 900))
+                self._store.import_snapshot(self.path("data.json"))
+
+        return self._store
+
+    @property
+    def history(self) -> HistoryStore:
+        """Observation history of this network"""
+        with self._lock:
+            if self._history is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._history = HistoryStore.from_env(self.path("history.db"))
+
+        return self._history
+
+    def publish_snapshot(self):
+        """Materialize data.json and its stats.json from the node store if it changed"""
+        started = time.perf_counter()
+        if self.store.publish(self.path("data.json"), [(self.path("stats.json"), compute_stats)]):
+            metrics.SNAPSHOT_WRITE_SECONDS.observe(time.perf_counter() - started)
+
+    def publish_graph(self, graph: PeerGraph, sources: List[str]):
+        """Write the topology of the last walk and its analytics to graph.json"""
+        analytics = graph.analyze(sources)
+        file_write_atomic(self.path("graph.json"), json.dumps(dict(
+            graph.to_json(),
+            generation=self.store.generation,
+            computed_at=datetime.utcnow().isoformat(),
+            analytics=analytics
+        ), separators=(",", ":")))
+        logging.info("{}: peer graph of {} nodes, {} links, {} components, largest {}".format(
+            self.name, analytics["nodes"], analytics["links"], analytics["components"]["count"],
+            analytics["components"]["largest"][:1]))
+
+    def write_status(self, status, nodes_count=0, scanning=False, last_scan=None):
+        """Write discovery status to status.json and stream it to clients when it changed"""
+        status_data = {
+            "status": status,
+            "nodes_count": nodes_count,
+            "scanning": scanning,
+            "last_scan": last_scan or datetime.utcnow().isoformat(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "generation": self.store.generation
+        }
+        file_write_atomic(self.path("status.json"), json.dumps(status_data))
+
+        with self._lock:
+            changed = (status, scanning, nodes_count) != self._last_status
+            self._last_status = (status, scanning, nodes_count)
+
+        if changed:
+            self.store.record_event("status", status_data)
+
+
+def networks_from_env(data_dir: str) -> List[Network]:
+    """Every network of NETWORKS (or NETWORK), the primary one first"""
+    names = network_names()
+    return [Network.from_env(name, network_dir(data_dir, names, name), primary=i == 0) for i, name in enumerate(names)]
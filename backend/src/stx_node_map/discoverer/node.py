@@ -0,0 +1,98 @@
+import sys
+from datetime import datetime
+from typing import Iterable, Optional
+
+from stx_node_map.util.version import ServerVersion, parse_server_version
+
+
+class Location:
+    """Where a node is, as served in the `location` field of the node documents"""
+
+    __slots__ = ("lat", "lng", "country", "city")
+
+    def __init__(self, lat: float, lng: float, country: str, city: str):
+        self.lat = lat
+        self.lng = lng
+        self.country = sys.intern(country or "Unknown")
+        self.city = sys.intern(city or "")
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Location":
+        """Accepts both the parse_location format (latitude, country_name) and the wire format (lat, country)"""
+        return cls(
+            data.get("latitude") or data.get("lat") or 0.0,
+            data.get("longitude") or data.get("lng") or 0.0,
+            data.get("country_name") or data.get("country"),
+            data.get("city")
+        )
+
+    def to_json(self) -> dict:
+        return {"lat": self.lat, "lng": self.lng, "country": self.country, "city": self.city}
+
+
+PRIVATE_LOCATION = Location(0.0, 0.0, "Private IP", "")
+UNKNOWN_LOCATION = Location(0.0, 0.0, "Unknown", "")
+
+
+class NodeRecord:
+    """One node as the discoverer stores and publishes it
+
+    Every job builds its results as records and writes them with to_json, so
+    the node documents in nodes.db and data.json have a single shape. Versions
+    are the shared objects of parse_server_version and location strings are
+    interned: thousands of nodes share a handful of versions and countries.
+    """
+
+    __slots__ = ("address", "server_version", "version", "burn_block_height", "last_seen", "node_type",
+                 "connection_status", "stacker_db_count", "location", "location_fetched_at", "stale_at")
+
+    # fields a /v2/info probe refreshes
+    PROBED = ("server_version", "version", "burn_block_height", "last_seen", "connection_status", "stacker_db_count")
+    # fields a geolocation refreshes
+    LOCATED = ("location", "location_fetched_at")
+
+    def __init__(self, address: str):
+        self.address = address
+        self.server_version: Optional[str] = None
+        self.version: ServerVersion = parse_server_version(None)
+        self.burn_block_height: Optional[int] = None
+        self.last_seen: Optional[str] = None
+        self.node_type: Optional[str] = None
+        self.connection_status = "offline"
+        self.stacker_db_count = 0
+        self.location: Optional[Location] = None
+        self.location_fetched_at: Optional[str] = None
+        self.stale_at: Optional[str] = None
+
+    def apply_info(self, node_info: dict, connection_status: str, seen_at: str):
+        """Take over the result of Prober.get_node_info"""
+        self.version = node_info.get("version") or parse_server_version(node_info.get("server_version"))
+        self.server_version = self.version.raw
+        self.burn_block_height = node_info.get("burn_block_height")
+        self.stacker_db_count = node_info.get("stacker_db_count", 0)
+        self.connection_status = connection_status
+        self.last_seen = seen_at
+
+    def apply_location(self, location: Location, fetched_at: Optional[float] = None):
+        self.location = location
+        if fetched_at is not None:
+            self.location_fetched_at = datetime.utcfromtimestamp(fetched_at).isoformat()
+
+    def to_json(self, fields: Optional[Iterable[str]] = None) -> dict:
+        """The node document, or only `fields` of it (plus address) for partial updates
+
+        Optional fields that aren't set (location_fetched_at, stale_at) are left out.
+        """
+        doc = {"address": self.address}
+
+        for name in fields if fields is not None else self.__slots__[1:]:
+            value = getattr(self, name)
+            if name == "version":
+                value = value.to_json()
+            elif name == "location":
+                value = value.to_json() if value is not None else None
+            elif value is None and name in ("location_fetched_at", "stale_at"):
+                continue
+            doc[name] = value
+
+        return doc
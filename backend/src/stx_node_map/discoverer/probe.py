@@ -0,0 +1,397 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from stx_node_map.discoverer import metrics
+from stx_node_map.discoverer.address import public_addresses
+from stx_node_map.discoverer.breaker import HostBreakers
+from stx_node_map.util import env_int
+from stx_node_map.util.version import parse_server_version
+
+GEOJS_HOST = "get.geojs.io"
+GEOJS_URL = "https://{}/v1/ip/geo.json".format(GEOJS_HOST)
+
+
+def same_address(host: str, port: int) -> Tuple[str, int]:
+    return host, port
+
+
+def make_core_api_url(host: str, endpoint: str = "neighbors", port: int = 20443):
+    if "stack" in host:
+        return "http://{}/v2/{}".format(host, endpoint)
+
+    if ":" in host:
+        # IPv6 literal
+        return "http://[{}]:{}/v2/{}".format(host, port, endpoint)
+
+    return "http://{}:{}/v2/{}".format(host, port, endpoint)
+
+
+def parse_location(data: dict) -> Optional[dict]:
+    """Map a GeoJS response to our format - None if essential data is missing"""
+    # Safely convert coordinates, handling "nil" or invalid values
+    try:
+        lat = data.get("latitude", 0)
+        lon = data.get("longitude", 0)
+        latitude = float(lat) if lat not in (None, "", "nil") else 0.0
+        longitude = float(lon) if lon not in (None, "", "nil") else 0.0
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+    if not data.get("country") and latitude == 0.0 and longitude == 0.0:
+        return None
+
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "country_name": data.get("country", ""),
+        "city": data.get("city", "")
+    }
+
+
+class Prober:
+    """Asynchronous network probes sharing one event loop
+
+    Every request holds a slot of the global semaphore plus a slot of the
+    semaphore of the host it talks to, so thousands of probes can be in
+    flight without any single node (or the geolocation service) getting
+    hammered. HTTP requests share one keep-alive connection pool sized to
+    the same limits, and connection setup is timed out separately from
+    reading the response. Use as an async context manager:
+
+        async with Prober.from_env() as prober:
+            info = await prober.get_node_info(address)
+
+    or keep one open for the whole process through a ProbeLoop.
+
+    Where probes go can be redirected before open() through core_api_url,
+    geo_url and tcp_address, which the benchmark uses to point a Prober at
+    a simulated network.
+
+    Node probes take the API and P2P ports of the node's network, so one
+    Prober serves every network of the process. They go through per-node
+    circuit breakers (see HostBreakers), shared by every job using this
+    Prober, so nodes that stopped answering aren't waited on again until
+    their cooldown is over.
+    """
+
+    def __init__(self, concurrency: int = 256, per_host: int = 2, geo_concurrency: int = 10,
+                 connect_timeout: float = 3.0, keepalive: float = 30.0, p2p_delay: float = 0.25,
+                 breakers: Optional[HostBreakers] = None):
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.geo_concurrency = max(1, geo_concurrency)
+        self.connect_timeout = connect_timeout
+        self.keepalive = keepalive
+        # head start of /v2/info before the P2P port check is raced against it
+        self.p2p_delay = p2p_delay
+        self.breakers = breakers or HostBreakers()
+        self.stats = {"requests": 0, "connections_created": 0, "connections_reused": 0}
+        self.core_api_url: Callable[[str, str, int], str] = make_core_api_url
+        self.geo_url = GEOJS_URL
+        self.tcp_address: Callable[[str, int], Tuple[str, int]] = same_address
+        # connection pool cap per (host, port) the requests go to, 0 for none
+        self.pool_per_host = max(self.per_host, self.geo_concurrency)
+        self._global: Optional[asyncio.Semaphore] = None
+        self._hosts: Dict[str, list] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def from_env(cls) -> "Prober":
+        return cls(
+            concurrency=env_int("DISCOVERER_CONCURRENCY", 256),
+            per_host=env_int("DISCOVERER_PER_HOST_CONCURRENCY", 2),
+            geo_concurrency=env_int("DISCOVERER_GEO_CONCURRENCY", 10),
+            connect_timeout=env_int("DISCOVERER_CONNECT_TIMEOUT", 3),
+            keepalive=env_int("DISCOVERER_KEEPALIVE", 30),
+            breakers=HostBreakers.from_env()
+        )
+
+    async def open(self):
+        async def on_request_start(session, ctx, params):
+            self.stats["requests"] += 1
+            metrics.HTTP_REQUESTS.inc()
+
+        async def on_connection_create_end(session, ctx, params):
+            self.stats["connections_created"] += 1
+            metrics.HTTP_CONNECTIONS.labels("created").inc()
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.stats["connections_reused"] += 1
+            metrics.HTTP_CONNECTIONS.labels("reused").inc()
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+
+        # the semaphores enforce the real per-host limits, the connector is a backstop
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.pool_per_host,
+            keepalive_timeout=self.keepalive,
+            ttl_dns_cache=300
+        )
+
+        self._global = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(connector=connector, trace_configs=[trace])
+        metrics.CIRCUITS_OPEN.set_function(self.breakers.open_count)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> "Prober":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def log_stats(self):
+        reused = self.stats["connections_reused"]
+        total = reused + self.stats["connections_created"]
+        logging.info("HTTP: {} requests, {} connections opened, {} reused ({:.0%})".format(
+            self.stats["requests"], self.stats["connections_created"], reused, reused / total if total else 0))
+
+    @asynccontextmanager
+    async def _slot(self, host: str, limit: Optional[int] = None):
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = self._hosts[host] = [asyncio.Semaphore(limit or self.per_host), 0]
+
+        entry[1] += 1
+        waiting = time.perf_counter()
+        try:
+            # take the host slot first so waiting on a busy host doesn't pin a global slot
+            async with entry[0]:
+                async with self._global:
+                    metrics.SLOT_WAIT_SECONDS.observe(time.perf_counter() - waiting)
+                    yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._hosts[host]
+
+    async def _get_json(self, host: str, url: str, timeout: float, limit: Optional[int] = None,
+                        probe: str = "http") -> Any:
+        timeout = aiohttp.ClientTimeout(
+            total=self.connect_timeout + timeout,
+            sock_connect=self.connect_timeout,
+            sock_read=timeout
+        )
+
+        with metrics.probe(probe):
+            async with self._slot(host, limit):
+                async with self._session.get(url, timeout=timeout) as resp:
+                    if resp.status != 200:
+                        metrics.failure(probe, "http_status")
+                        return None
+
+                    return await resp.json(content_type=None)
+
+    async def check_port_open(self, host: str, port: int, timeout: float = 2.0) -> bool:
+        """Check if a TCP port is open on the host"""
+        with metrics.probe("check_port_open"):
+            async with self._slot(host):
+                try:
+                    _, writer = await asyncio.wait_for(asyncio.open_connection(*self.tcp_address(host, port)),
+                                                       min(timeout, self.connect_timeout))
+                except asyncio.TimeoutError:
+                    metrics.failure("check_port_open", "timeout")
+                    return False
+                except OSError:
+                    metrics.failure("check_port_open", "closed")
+                    return False
+
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+                return True
+
+    async def ip_to_locations(self, ips: List[str], batch_size: int = 50) -> Dict[str, Optional[dict]]:
+        """Fetch geolocation from GeoJS.io (unlimited calls, no rate limits) in comma-separated batches
+
+        IPs GeoJS has no usable data for map to None. IPs of a batch whose
+        request failed are left out, so they aren't mistaken for dead lookups.
+        """
+        async def fetch(batch):
+            url = "{}?ip={}".format(self.geo_url, ",".join(batch))
+            try:
+                data = await self._get_json(GEOJS_HOST, url, 10, self.geo_concurrency, probe="ip_to_locations")
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logging.warning("Geolocation batch of {} failed: {}".format(len(batch), e))
+                return {}
+
+            if isinstance(data, dict):
+                data = [data]
+
+            if not isinstance(data, list):
+                if data is not None:
+                    metrics.failure("ip_to_locations", "invalid_response")
+                return {}
+
+            by_ip = {d.get("ip"): d for d in data if isinstance(d, dict)}
+            return {ip: parse_location(by_ip[ip]) if ip in by_ip else None for ip in batch}
+
+        results = {}
+        batches = [ips[i:i + batch_size] for i in range(0, len(ips), batch_size)]
+        for located in await asyncio.gather(*[fetch(b) for b in batches]):
+            results.update(located)
+
+        return results
+
+    async def _fetch_info(self, host: str, port: int) -> Optional[dict]:
+        try:
+            resp = await self._get_json(host, self.core_api_url(host, "info", port), 10, probe="get_node_info")
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+
+        if resp is not None and not isinstance(resp, dict):
+            metrics.failure("get_node_info", "invalid_response")
+            return None
+
+        return resp
+
+    async def get_node_info(self, host: str, port: int = 20443, p2p_port: int = 20444) -> dict:
+        """Fetch /v2/info for a node and extract version details and burn_block_height
+
+        Returns dict with:
+        - server_version, version (parsed, a ServerVersion), burn_block_height: node info (if API available)
+        - api_available: True if the API port (20443 on mainnet) responded
+        - p2p_available: True if the P2P port (20444 on mainnet) is open
+        - stacker_db_count: Number of Stacker DBs (from stackerdbs property)
+
+        Like happy eyeballs, /v2/info gets a head start of p2p_delay seconds,
+        then the P2P port check runs alongside it, so a node without API
+        costs one timeout instead of two in a row. Nodes whose circuit is
+        open are reported offline without being contacted.
+        """
+        node = (host, port)
+        if not self.breakers.allow(node):
+            metrics.failure("get_node_info", "circuit_open")
+            resp, p2p_available = None, False
+        else:
+            api = asyncio.ensure_future(self._fetch_info(host, port))
+            p2p = None
+            try:
+                done, _ = await asyncio.wait([api], timeout=self.p2p_delay)
+                if not done:
+                    p2p = asyncio.ensure_future(self.check_port_open(host, p2p_port, timeout=3.0))
+
+                resp = await api
+                p2p_available = None  # Don't check P2P if API works
+                if resp is None:
+                    p2p_available = await (p2p or self.check_port_open(host, p2p_port, timeout=3.0))
+            except asyncio.CancelledError:
+                self.breakers.release(node)
+                raise
+            finally:
+                for task in (api, p2p):
+                    if task is not None and not task.done():
+                        task.cancel()
+
+            if resp is not None or p2p_available:
+                self.breakers.success(node)
+            else:
+                self.breakers.failure(node)
+
+        if resp is not None:
+            server_version = resp.get("server_version", "")
+
+            return {
+                "server_version": server_version,
+                "version": parse_server_version(server_version),
+                "burn_block_height": resp.get("burn_block_height"),
+                "api_available": True,
+                "p2p_available": None,
+                "stacker_db_count": len(resp.get("stackerdbs") or [])
+            }
+
+        return {
+            "server_version": None,
+            "version": parse_server_version(None),
+            "burn_block_height": None,
+            "api_available": False,
+            "p2p_available": p2p_available,
+            "stacker_db_count": 0
+        }
+
+    async def get_neighbors(self, host: str, port: int = 20443) -> List[str]:
+        # only get_node_info, which also checks the P2P port, decides whether a node is dead
+        if self.breakers.is_open((host, port)):
+            metrics.failure("get_neighbors", "circuit_open")
+            return []
+
+        try:
+            resp = await self._get_json(host, self.core_api_url(host, "neighbors", port), 4, probe="get_neighbors")
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return []
+
+        self.breakers.success((host, port))
+
+        try:
+            # collect all ip addresses
+            all_ = [x["ip"] for x in resp["sample"]] + [x["ip"] for x in resp["inbound"]] + \
+                   [x["ip"] for x in resp["outbound"]]
+        except (LookupError, TypeError):
+            if resp is not None:
+                metrics.failure("get_neighbors", "invalid_response")
+            return []
+
+        # make the list unique and skip private addresses
+        return public_addresses(all_)
+
+    async def get_nodes_info(self, addresses: List[str], port: int = 20443, p2p_port: int = 20444) -> Dict[str, dict]:
+        """Concurrently fetch /v2/info for many nodes"""
+        infos = await asyncio.gather(*[self.get_node_info(a, port, p2p_port) for a in addresses])
+        results = dict(zip(addresses, infos))
+
+        for address, info in results.items():
+            logging.info("Updated info for {}: {}".format(address, info["version"].version or "unknown"))
+
+        return results
+
+
+class ProbeLoop:
+    """Event loop thread owning a Prober for the lifetime of the process
+
+    Jobs submitted from any thread run on this loop, so the discovery walk
+    and the periodic rescan share one connection pool and one set of
+    concurrency limits.
+    """
+
+    def __init__(self, prober: Prober):
+        self.prober = prober
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="probe-loop", daemon=True)
+        self._thread.start()
+        self._submit(prober.open())
+
+    def _submit(self, coro: Awaitable) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def run(self, job: Callable[[Prober], Awaitable]) -> Any:
+        """Run job(prober) on the loop and wait for its result"""
+        try:
+            return self._submit(job(self.prober))
+        finally:
+            self.prober.log_stats()
+
+    def close(self):
+        if not self.loop.is_running():
+            return
+
+        self._submit(self.prober.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
@@ -0,0 +1,203 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from stx_node_map.util import env_int
+
+# connection statuses of nodes that answered at all
+REACHABLE = ("api", "p2p_only")
+
+
+class NodeHistory:
+    """What the scheduler remembers about one node
+
+    - status: connection status of the last probe
+    - streak: consecutive probes that returned that same status
+    - failures: consecutive probes that found the node offline
+    - flaps: status changes, halved on every probe so old ones fade out
+    """
+
+    def __init__(self, status: Optional[str] = None):
+        self.status = status
+        self.streak = 0
+        self.failures = 1 if status == "offline" else 0
+        self.flaps = 0.0
+
+    def record(self, status: str):
+        self.flaps /= 2
+
+        if self.status is not None and status != self.status:
+            self.flaps += 1
+            self.streak = 0
+
+        self.streak += 1
+        self.failures = 0 if status in REACHABLE else self.failures + 1
+        self.status = status
+
+
+class RescanScheduler:
+    """Priority queue of nodes keyed by when each should be probed next
+
+    Intervals follow each node's history: a node that just changed status
+    is re-probed after `flapping` seconds, reachable nodes start at `base`
+    and back off up to `stable_max` as their status holds, and offline nodes
+    back off exponentially from `base` up to `dead_max`. Due times get
+    +-10% jitter so nodes probed together drift apart over time.
+
+    Entries are never removed from the heap, a node's current due time lives
+    in `due` and heap entries that don't match it are skipped when popped.
+    """
+
+    def __init__(self, base: int = 300, stable_max: int = 1800, flapping: int = 60, dead_max: int = 21600,
+                 budget: int = 32):
+        self.base = base
+        self.stable_max = stable_max
+        self.flapping = flapping
+        self.dead_max = dead_max
+        self.budget = budget
+        self.history: Dict[str, NodeHistory] = {}
+        self.due: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    @classmethod
+    def from_env(cls) -> "RescanScheduler":
+        return cls(
+            base=env_int("DISCOVERER_RESCAN_INTERVAL", 300),
+            stable_max=env_int("DISCOVERER_RESCAN_STABLE_MAX", 1800),
+            flapping=env_int("DISCOVERER_RESCAN_FLAPPING_INTERVAL", 60),
+            dead_max=env_int("DISCOVERER_RESCAN_DEAD_MAX", 21600),
+            budget=env_int("DISCOVERER_RESCAN_BUDGET", 32)
+        )
+
+    def __len__(self):
+        return len(self.due)
+
+    def _push(self, address: str, due: float):
+        self.due[address] = due
+        heapq.heappush(self._heap, (due, address))
+
+    def interval(self, history: NodeHistory) -> float:
+        """Seconds until a node with this history should be probed again"""
+        if history.flaps >= 1:
+            return self.flapping
+
+        if history.failures:
+            return min(self.dead_max, self.base * 2 ** (history.failures - 1))
+
+        return min(self.stable_max, self.base * 2 ** (history.streak // 3))
+
+    def sync(self, statuses: Dict[str, Optional[str]], now: float):
+        """Track exactly the given address -> stored connection status
+
+        New nodes are spread evenly over the next base interval instead of
+        all falling due at once, nodes that are gone are forgotten.
+        """
+        for address in list(self.due):
+            if address not in statuses:
+                del self.due[address]
+                del self.history[address]
+
+        for address, status in statuses.items():
+            if address not in self.due:
+                self.history[address] = NodeHistory(status)
+                self._push(address, now + random.uniform(0, self.base))
+
+    def record(self, address: str, status: str, now: float):
+        """Reschedule a node after it was probed"""
+        history = self.history.get(address)
+        if history is None:
+            return  # forgotten while it was being probed
+
+        history.record(status)
+        self._push(address, now + self.interval(history) * random.uniform(0.9, 1.1))
+
+    def pop_due(self, now: float, limit: int) -> List[str]:
+        """Up to limit nodes whose due time has passed, most overdue first"""
+        due = []
+
+        while self._heap and len(due) < limit and self._heap[0][0] <= now:
+            at, address = heapq.heappop(self._heap)
+            if self.due.get(address) == at:
+                # popped nodes stay known but unscheduled until record()
+                self.due[address] = float("inf")
+                due.append(address)
+
+        return due
+
+    def next_due(self) -> Optional[float]:
+        while self._heap and self.due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+        return self._heap[0][0] if self._heap else None
+
+
+async def drain(scheduler: RescanScheduler, probe: Callable[[str], Awaitable[Tuple[str, dict]]],
+                load: Callable[[], Dict[str, Optional[str]]], flush: Callable[[Dict[str, dict]], None],
+                sync_interval: float = 30.0, flush_interval: float = 30.0):
+    """Probe nodes as they fall due, forever
+
+    - probe(address) returns (connection status, fields to store)
+    - load() returns the address -> connection status of the nodes to track
+    - flush(updates) persists the fields collected since the last flush
+
+    At most scheduler.budget probes are in flight at any time. The tracked
+    nodes are refreshed from load() every sync_interval seconds so nodes
+    found by the discovery walk are picked up.
+    """
+    in_flight: Dict[asyncio.Future, str] = {}
+    updates: Dict[str, dict] = {}
+    synced_at = flushed_at = 0.0
+
+    while True:
+        now = time.time()
+
+        if now - synced_at >= sync_interval:
+            scheduler.sync(load(), now)
+            synced_at = now
+
+        for address in scheduler.pop_due(now, scheduler.budget - len(in_flight)):
+            in_flight[asyncio.ensure_future(probe(address))] = address
+
+        next_due = scheduler.next_due()
+        wait = min(sync_interval, max(0.0, next_due - now)) if next_due is not None else sync_interval
+        if len(in_flight) >= scheduler.budget:
+            wait = sync_interval
+
+        if in_flight:
+            done, _ = await asyncio.wait(list(in_flight), timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+        else:
+            done = set()
+            await asyncio.sleep(wait)
+
+        now = time.time()
+        for future in done:
+            address = in_flight.pop(future)
+            try:
+                status, fields = future.result()
+            except Exception as e:
+                logging.warning("Rescan of {} failed: {}".format(address, e))
+                status, fields = "offline", None
+
+            scheduler.record(address, status, now)
+            if fields is not None:
+                updates[address] = fields
+
+        if updates and now - flushed_at >= flush_interval:
+            flush(updates)
+            updates = {}
+            flushed_at = now
+
+
+def summarize(scheduler: RescanScheduler, now: float) -> Dict[str, int]:
+    """Count of tracked nodes by how soon they are due, for logging"""
+    buckets = {"due": 0, "<5m": 0, "<1h": 0, ">=1h": 0}
+    for at in scheduler.due.values():
+        wait = at - now
+        key = "due" if wait <= 0 else "<5m" if wait < 300 else "<1h" if wait < 3600 else ">=1h"
+        buckets[key] += 1
+
+    return buckets
+
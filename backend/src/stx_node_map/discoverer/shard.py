@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+from bisect import bisect
+from typing import Callable, Dict, List, Optional, Tuple
+
+# points per shard on the hash ring, more spread the addresses more evenly
+RING_REPLICAS = 64
+
+# seconds between liveness checks of the shard processes
+CHECK_INTERVAL = 5.0
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class ShardRing:
+    """Consistent hashing of addresses onto shards
+
+    An address always lands on the same shard, so the shard's connection
+    pool and circuit breakers keep their state for it from walk to walk,
+    and changing the number of shards only moves about 1/count of the
+    addresses.
+    """
+
+    def __init__(self, count: int, replicas: int = RING_REPLICAS):
+        points = sorted((_hash("shard-{}-{}".format(i, r)), i) for i in range(count) for r in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._shards = [i for _, i in points]
+
+    def shard(self, address: str) -> int:
+        return self._shards[bisect(self._hashes, _hash(address)) % len(self._hashes)]
+
+
+class ShardError(Exception):
+    pass
+
+
+def _shard_main(index: int, count: int, inbox, outbox, setup: Optional[Callable], level: int, metrics_port: int):
+    """Entry point of a shard process: serve probe tasks from inbox until it gets None"""
+    from stx_node_map.discoverer import _probe_fields, _probe_record, metrics
+    from stx_node_map.discoverer.probe import Prober
+
+    logging.getLogger().setLevel(level)
+    if metrics_port:
+        metrics.serve(metrics_port + 1 + index)
+
+    async def handle(prober: Prober, kind: str, args: tuple):
+        if kind == "neighbors":
+            return await prober.get_neighbors(*args)
+        if kind == "probe":
+            return await _probe_record(prober, *args)
+        if kind == "fields":
+            return await _probe_fields(prober, *args)
+        raise ValueError("Unknown shard task {}".format(kind))
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        prober = Prober.from_env()
+        # the shards split the global limit between them
+        prober.concurrency = max(1, prober.concurrency // count)
+        if setup is not None:
+            setup(prober)
+
+        def receive() -> list:
+            # everything queued up, so a burst of tasks costs one executor round trip
+            messages = [inbox.get()]
+            while messages[-1] is not None:
+                try:
+                    messages.append(inbox.get_nowait())
+                except queue.Empty:
+                    break
+            return messages
+
+        def reply(task_id: int, task: asyncio.Future):
+            error = task.exception()
+            outbox.put((task_id, None if error else task.result(), repr(error) if error else None))
+
+        async with prober:
+            tasks = set()
+            stopped = False
+            while not stopped:
+                for message in await loop.run_in_executor(None, receive):
+                    if message is None:
+                        stopped = True
+                        break
+
+                    task_id, kind, args = message
+                    task = asyncio.ensure_future(handle(prober, kind, args))
+                    task.add_done_callback(lambda t, task_id=task_id: reply(task_id, t))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+        logging.info("Shard {} stopped".format(index))
+
+    asyncio.run(serve())
+
+
+class ShardPool:
+    """Discovery probes spread over `count` worker processes
+
+    Each process runs its own event loop and Prober and gets the addresses
+    ShardRing assigns to it, so parsing, record building and logging for
+    thousands of nodes run on all cores instead of contending for one GIL.
+    The walk and the rescan both probe through the pool, so a node's circuit
+    breaker lives in one shard and sees every probe of it. With
+    `metrics_port` set, shard i serves its probe metrics on metrics_port + 1 + i.
+    Tasks go out over one queue per shard and come back, as plain JSON
+    values, over a shared result queue. Awaiting a task from the event loop
+    of the coordinator works like awaiting a local probe. A shard process
+    that dies is restarted and its pending tasks fail with ShardError.
+
+    `setup(prober)` is called in every shard before it opens its Prober,
+    it has to be picklable.
+    """
+
+    def __init__(self, count: int, setup: Optional[Callable] = None, metrics_port: int = 0):
+        self.count = count
+        self.ring = ShardRing(count)
+        self._setup = setup
+        self._metrics_port = metrics_port
+        self._context = multiprocessing.get_context("spawn")
+        self._inboxes = [self._context.Queue() for _ in range(count)]
+        self._outbox = self._context.Queue()
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * count
+        self._pending: Dict[int, Tuple[asyncio.Future, int]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        for i in range(count):
+            self._start(i)
+
+        self._reader = threading.Thread(target=self._read, name="shard-results", daemon=True)
+        self._reader.start()
+        logging.info("Started {} discovery shards".format(count))
+
+    def _start(self, index: int):
+        process = self._context.Process(
+            target=_shard_main,
+            args=(index, self.count, self._inboxes[index], self._outbox, self._setup, logging.getLogger().level,
+                  self._metrics_port),
+            name="discoverer-shard-{}".format(index),
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result, error: Optional[str]):
+        if future.done():
+            return
+
+        if error is not None:
+            future.set_exception(ShardError(error))
+        else:
+            future.set_result(result)
+
+    def _read(self):
+        while True:
+            try:
+                message = self._outbox.get(timeout=CHECK_INTERVAL)
+            except queue.Empty:
+                self._check()
+                continue
+
+            if message is None:
+                return
+
+            task_id, result, error = message
+            with self._lock:
+                future, _ = self._pending.pop(task_id, (None, None))
+
+            if future is not None:
+                future.get_loop().call_soon_threadsafe(self._resolve, future, result, error)
+
+    def _check(self):
+        """Restart dead shards and fail the tasks they took with them"""
+        for i, process in enumerate(self._processes):
+            if self._closed or process.is_alive():
+                continue
+
+            logging.warning("Discovery shard {} exited with {}, restarting it".format(i, process.exitcode))
+            with self._lock:
+                lost = [task_id for task_id, (_, shard) in self._pending.items() if shard == i]
+                futures = [self._pending.pop(task_id)[0] for task_id in lost]
+
+            for future in futures:
+                future.get_loop().call_soon_threadsafe(self._resolve, future, None, "shard {} died".format(i))
+
+            self._start(i)
+
+    async def _call(self, address: str, kind: str, *args):
+        shard = self.ring.shard(address)
+        future = asyncio.get_running_loop().create_future()
+
+        with self._lock:
+            task_id = next(self._ids)
+            self._pending[task_id] = (future, shard)
+
+        self._inboxes[shard].put((task_id, kind, args))
+        return await future
+
+    async def get_neighbors(self, address: str, port: int = 20443) -> List[str]:
+        """Prober.get_neighbors on the address' shard"""
+        try:
+            return await self._call(address, "neighbors", address, port)
+        except ShardError as e:
+            logging.warning("Neighbors of {} lost: {}".format(address, e))
+            return []
+
+    async def probe(self, address: str, neighbors: Optional[List[str]], location: Optional[dict],
+                    fetched_at: Optional[float], port: int = 20443,
+                    p2p_port: int = 20444) -> Optional[Tuple[str, List[str], dict]]:
+        """(address, neighbors, node document) built on the address' shard, None if the shard failed"""
+        try:
+            return await self._call(address, "probe", address, neighbors, location, fetched_at, port, p2p_port)
+        except ShardError as e:
+            logging.warning("Probe of {} lost: {}".format(address, e))
+            return None
+
+    async def probe_fields(self, address: str, port: int = 20443, p2p_port: int = 20444) -> Tuple[str, dict]:
+        """(connection status, probed fields) of a rescan, built on the address' shard; raises ShardError"""
+        return tuple(await self._call(address, "fields", address, port, p2p_port))
+
+    def close(self):
+        self._closed = True
+        for inbox in self._inboxes:
+            inbox.put(None)
+
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+        self._outbox.put(None)
+        self._reader.join()
@@ -0,0 +1,47 @@
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from stx_node_map.util import bucket_label, bucket_labels
+from stx_node_map.util.version import version_key
+
+# upper bounds (inclusive) of the burn block lag buckets, anything above falls in the last one
+LAG_BUCKETS = (0, 1, 5, 20, 100)
+
+
+def _tally(values: Iterable[Optional[str]]) -> dict:
+    counts = Counter(v if v else "unknown" for v in values)
+    return dict(counts.most_common())
+
+
+def compute_stats(nodes: List[dict], generation: int) -> dict:
+    """Aggregate the active nodes of a snapshot into the document served by /stats"""
+    stale_count = sum(1 for n in nodes if n.get("stale_at"))
+    nodes = [n for n in nodes if not n.get("stale_at")]
+    heights = sorted(n["burn_block_height"] for n in nodes if isinstance(n.get("burn_block_height"), int))
+    tip = heights[-1] if heights else None
+
+    lag = Counter(bucket_label(tip - h, LAG_BUCKETS) for h in heights)
+    lag["unknown"] = len(nodes) - len(heights)
+
+    versions = [v for v in ((n.get("version") or {}).get("version") for n in nodes) if v]
+    latest = max(versions, key=version_key, default=None)
+
+    return {
+        "generation": generation,
+        "computed_at": datetime.utcnow().isoformat(),
+        "nodes_count": len(nodes),
+        "stale_count": stale_count,
+        "versions": _tally((n.get("version") or {}).get("version") for n in nodes),
+        "latest_version": latest,
+        "behind_latest": sum(1 for v in versions if version_key(v) < version_key(latest)),
+        "countries": _tally((n.get("location") or {}).get("country") for n in nodes),
+        "connection_status": _tally(n.get("connection_status") for n in nodes),
+        "node_type": _tally(n.get("node_type") for n in nodes),
+        "burn_block_height": {
+            "tip": tip,
+            "min": heights[0] if heights else None,
+            "median": heights[len(heights) // 2] if heights else None,
+            "lag": {bucket: lag[bucket] for bucket in bucket_labels(LAG_BUCKETS) + ["unknown"]}
+        }
+    }
@@ -0,0 +1,309 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from stx_node_map.util import file_read, file_write_atomic
+
+# node fields kept in their own columns so reads can be filtered in SQL
+INDEXED_FIELDS = ("connection_status", "node_type", "last_seen", "stale_at")
+
+# how many events are kept for clients resuming a stream
+EVENTS_RETAINED = 100000
+
+
+class NodeStore:
+    """SQLite-backed store of known nodes
+
+    Each node is one row holding its JSON document, written only when its
+    content actually changed. Every change bumps a revision counter so the
+    JSON snapshot served by the API is rewritten only when it is stale.
+
+    This is the single owner of node data in the process: all reads and
+    writes, including publishing, are serialized by one lock, so the
+    discovery walk and the periodic rescan can't clobber each other and
+    every snapshot reflects exactly one revision. Snapshots are published
+    atomically and carry that revision as their generation:
+
+        {"generation": 42, "published_at": "...", "nodes": [...]}
+
+    Nodes no discovery walk finds and no probe reaches for a number of
+    walks in a row are marked stale (their document gets a stale_at
+    timestamp); stale nodes are deleted once they have been stale for the
+    retention period, see sweep().
+
+    Every node write also appends a node_added / node_changed /
+    node_removed event (with just the changed fields) to the events table
+    in the same transaction, which the API streams to clients. A write
+    that would only move last_seen forward by less than
+    last_seen_resolution seconds is skipped, so probes that found nothing
+    new don't rewrite the snapshot.
+    """
+
+    def __init__(self, path: str, last_seen_resolution: int = 0):
+        self.last_seen_resolution = last_seen_resolution
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets API workers read events while the discoverer writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS nodes ("
+            "address TEXT PRIMARY KEY, connection_status TEXT, node_type TEXT, last_seen TEXT, data TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS nodes_connection_status ON nodes (connection_status);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL, data TEXT NOT NULL, created_at REAL NOT NULL);"
+        )
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(nodes)")}
+
+        if "stale_at" not in columns:
+            self._conn.execute("ALTER TABLE nodes ADD COLUMN stale_at TEXT")
+        if "missed" not in columns:
+            # consecutive discovery walks that neither found nor reached the node
+            self._conn.execute("ALTER TABLE nodes ADD COLUMN missed INTEGER NOT NULL DEFAULT 0")
+
+        self._conn.execute("CREATE INDEX IF NOT EXISTS nodes_stale_at ON nodes (stale_at)")
+
+    def _event(self, type_: str, data: dict):
+        self._conn.execute(
+            "INSERT INTO events (type, data, created_at) VALUES (?, ?, ?)", (type_, json.dumps(data), time.time())
+        )
+
+    def record_event(self, type_: str, data: dict):
+        """Append an event that isn't a node change, e.g. a status transition"""
+        with self._lock:
+            self._event(type_, data)
+            self._conn.commit()
+
+    def _meta(self, key: str) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_meta(self, key: str, value: int):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _bump(self):
+        self._set_meta("revision", self._meta("revision") + 1)
+
+    @staticmethod
+    def _where(filters: dict):
+        unknown = set(filters) - set(INDEXED_FIELDS)
+        if unknown:
+            raise ValueError("Cannot filter nodes on {}".format(", ".join(sorted(unknown))))
+
+        if not filters:
+            return "", []
+
+        # IS matches like = and also lets None select NULL, e.g. stale_at=None for active nodes
+        return " WHERE " + " AND ".join("{} IS ?".format(k) for k in filters), list(filters.values())
+
+    @property
+    def generation(self) -> int:
+        """Revision of the last published snapshot"""
+        with self._lock:
+            return self._meta("published")
+
+    def count(self, **filters) -> int:
+        where, args = self._where(filters)
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM nodes" + where, args).fetchone()[0]
+
+    def addresses(self, **filters) -> List[str]:
+        """Addresses of the nodes matching the given column filters, e.g. connection_status="api", stale_at=None"""
+        where, args = self._where(filters)
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT address FROM nodes" + where + " ORDER BY rowid", args)]
+
+    def first(self) -> Optional[dict]:
+        """The oldest node document, None if the store is empty"""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM nodes ORDER BY rowid LIMIT 1").fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def _write(self, node: dict) -> bool:
+        data = json.dumps(node, sort_keys=True)
+        row = self._conn.execute("SELECT data FROM nodes WHERE address = ?", (node["address"],)).fetchone()
+
+        if row is not None and row[0] == data:
+            return False
+
+        old = json.loads(row[0]) if row is not None else None
+        if old is not None and self._seen_only(old, node):
+            return False
+
+        values = [node.get(k) for k in INDEXED_FIELDS]
+        if row is None:
+            self._conn.execute(
+                "INSERT INTO nodes (address, connection_status, node_type, last_seen, stale_at, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [node["address"]] + values + [data]
+            )
+            self._event("node_added", node)
+        else:
+            self._conn.execute(
+                "UPDATE nodes SET connection_status = ?, node_type = ?, last_seen = ?, stale_at = ?, data = ? "
+                "WHERE address = ?",
+                values + [data, node["address"]]
+            )
+            self._event("node_changed", {
+                "address": node["address"],
+                "fields": {k: v for k, v in node.items() if old.get(k) != v},
+                "removed_fields": [k for k in old if k not in node]
+            })
+
+        return True
+
+    def _seen_only(self, old: dict, node: dict) -> bool:
+        """Whether node differs from old in nothing but a recent enough last_seen"""
+        if old.keys() != node.keys() or any(old[k] != node[k] for k in node if k != "last_seen"):
+            return False
+
+        try:
+            moved = datetime.fromisoformat(node["last_seen"]) - datetime.fromisoformat(old["last_seen"])
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        return moved.total_seconds() < self.last_seen_resolution
+
+    def upsert_many(self, nodes: Iterable[dict]) -> int:
+        """Insert or replace whole node documents, returns how many actually changed"""
+        with self._lock:
+            changed = sum(1 for node in nodes if self._write(node))
+            if changed:
+                self._bump()
+            self._conn.commit()
+
+        return changed
+
+    def update_many(self, updates: Dict[str, dict]) -> int:
+        """Merge fields into existing nodes (unknown addresses are ignored), returns how many changed"""
+        changed = 0
+
+        with self._lock:
+            for address, fields in updates.items():
+                row = self._conn.execute("SELECT data FROM nodes WHERE address = ?", (address,)).fetchone()
+                if row is None:
+                    continue
+
+                node = json.loads(row[0])
+                node.update(fields)
+                changed += self._write(node)
+
+            if changed:
+                self._bump()
+            self._conn.commit()
+
+        return changed
+
+    def clear(self):
+        with self._lock:
+            for (address,) in self._conn.execute("SELECT address FROM nodes").fetchall():
+                self._event("node_removed", {"address": address})
+
+            self._conn.execute("DELETE FROM nodes")
+            self._bump()
+            self._conn.commit()
+
+    def sweep(self, found: Iterable[str], stale_after: int, retention: int) -> Tuple[int, int]:
+        """Age the nodes after a discovery walk, returns (nodes that went stale, nodes deleted)
+
+        A node is missed when the walk didn't find it and its last probe
+        found it offline. After stale_after misses in a row it is marked
+        stale, which keeps it out of rescans and of the default API output.
+        Nodes stale for more than retention seconds are deleted, clients see
+        a node_removed event. Stale nodes the walk finds again are written
+        afresh by upsert_many and become active again.
+        """
+        now = datetime.utcnow()
+
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS found (address TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM found")
+            self._conn.executemany("INSERT OR IGNORE INTO found (address) VALUES (?)", ((a,) for a in found))
+            self._conn.execute(
+                "UPDATE nodes SET missed = CASE "
+                "WHEN address IN (SELECT address FROM found) OR IFNULL(connection_status, 'offline') != 'offline' "
+                "THEN 0 ELSE missed + 1 END"
+            )
+
+            rows = self._conn.execute(
+                "SELECT data FROM nodes WHERE stale_at IS NULL AND missed >= ?", (stale_after,)
+            ).fetchall()
+            for (data,) in rows:
+                self._write(dict(json.loads(data), stale_at=now.isoformat()))
+
+            cutoff = (now - timedelta(seconds=retention)).isoformat()
+            expired = [r[0] for r in self._conn.execute(
+                "SELECT address FROM nodes WHERE stale_at < ?", (cutoff,)
+            ).fetchall()]
+            for address in expired:
+                self._event("node_removed", {"address": address})
+            self._conn.executemany("DELETE FROM nodes WHERE address = ?", ((a,) for a in expired))
+
+            if rows or expired:
+                self._bump()
+            self._conn.commit()
+
+        return len(rows), len(expired)
+
+    def import_snapshot(self, path: str) -> int:
+        """Seed an empty store from an existing JSON snapshot"""
+        if self.count() > 0 or not os.path.exists(path):
+            return 0
+
+        try:
+            nodes = json.loads(file_read(path))
+        except (OSError, ValueError):
+            return 0
+
+        # older snapshots are a bare list of nodes
+        if isinstance(nodes, dict):
+            nodes = nodes.get("nodes")
+
+        if not isinstance(nodes, list):
+            return 0
+
+        imported = self.upsert_many(n for n in nodes if isinstance(n, dict) and n.get("address"))
+        logging.info("Imported {} nodes from {}".format(imported, path))
+        return imported
+
+    def publish(self, path: str, derived: Iterable[Tuple[str, Callable[[List[dict], int], Any]]] = ()) -> bool:
+        """Atomically replace the JSON snapshot if anything changed since it was last written
+
+        Each (path, build) in derived is written alongside it as
+        build(nodes, generation), from exactly the same revision.
+        """
+        derived = list(derived)
+
+        with self._lock:
+            revision = self._meta("revision")
+            if revision == self._meta("published") and os.path.exists(path) and \
+                    all(os.path.exists(p) for p, _ in derived):
+                return False
+
+            rows = self._conn.execute("SELECT data FROM nodes ORDER BY rowid").fetchall()
+            file_write_atomic(path, '{{"generation": {}, "published_at": {}, "nodes": [{}]}}'.format(
+                revision, json.dumps(datetime.utcnow().isoformat()), ",".join(r[0] for r in rows)))
+
+            if derived:
+                nodes = [json.loads(r[0]) for r in rows]
+                for derived_path, build in derived:
+                    file_write_atomic(derived_path, json.dumps(build(nodes, revision)))
+
+            self._set_meta("published", revision)
+            self._conn.execute(
+                "DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?", (EVENTS_RETAINED,)
+            )
+            self._conn.commit()
+
+        logging.info("Published snapshot of {} nodes (revision {})".format(len(rows), revision))
+        return True
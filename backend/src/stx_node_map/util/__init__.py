@@ -1,5 +1,7 @@
 import os
-from typing import Any, Union
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, List, Sequence, Union
 
 
 def file_write(path: str, data: Any, mode: str = 'w'):
@@ -8,6 +10,32 @@ def file_write(path: str, data: Any, mode: str = 'w'):
         f.close()
 
 
+def file_write_atomic(path: str, data: str):
+    """Replace the file in one step, readers see either the old or the new content"""
+    dir_ = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dir_, prefix='.{}.'.format(os.path.basename(path)))
+
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    # persist the rename itself
+    dir_fd = os.open(dir_, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
 def file_read(path: str, mode='r') -> Any:
     with open(path, mode) as f:
         output = f.read()
@@ -28,3 +56,44 @@ def assert_env_vars(*args) -> Union[list, str]:
         li.append(v)
 
     return li[0] if len(li) == 1 else li
+
+
+def env_int(name: str, default: int) -> int:
+    v = os.environ.get(name)
+
+    if v is None or v.strip() == '':
+        return default
+
+    try:
+        return int(v)
+    except ValueError:
+        raise AssertionError('{} environment variable must be an integer'.format(name))
+
+
+def parse_timestamp(value: str, name: str) -> datetime:
+    """An ISO timestamp as an aware UTC datetime, naive ones are taken as UTC"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError('{} must be an ISO timestamp'.format(name))
+
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+
+    return parsed.astimezone(timezone.utc)
+
+
+def bucket_label(value: int, bounds: Sequence[int]) -> str:
+    """Histogram bucket of value: "0", "1-4", ... up to the last bound, then ">last" """
+    lower = 0
+    for upper in bounds:
+        if value <= upper:
+            return str(upper) if lower == upper else '{}-{}'.format(lower, upper)
+        lower = upper + 1
+
+    return '>{}'.format(bounds[-1])
+
+
+def bucket_labels(bounds: Sequence[int]) -> List[str]:
+    """Every label bucket_label gives for bounds, in order"""
+    return [bucket_label(b, bounds) for b in bounds] + ['>{}'.format(bounds[-1])]
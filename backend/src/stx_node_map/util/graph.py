@@ -0,0 +1,149 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from stx_node_map.util import bucket_label, bucket_labels
+
+# upper bounds (inclusive) of the degree buckets, anything above falls in the last one
+DEGREE_BUCKETS = (0, 1, 4, 9, 19, 49, 99)
+
+# component sizes listed by analyze, largest first
+TOP_COMPONENTS = 10
+
+
+def _degree_stats(degrees: List[int]) -> dict:
+    ordered = sorted(degrees)
+    histogram = Counter(bucket_label(d, DEGREE_BUCKETS) for d in degrees)
+
+    return {
+        "mean": round(sum(ordered) / len(ordered), 2) if ordered else None,
+        "median": ordered[len(ordered) // 2] if ordered else None,
+        "max": ordered[-1] if ordered else None,
+        "histogram": {bucket: histogram[bucket] for bucket in bucket_labels(DEGREE_BUCKETS)}
+    }
+
+
+class PeerGraph:
+    """Who lists whom as a peer, in compressed sparse row form
+
+    Nodes are numbered by their position in `nodes`. The peers node i
+    reported are targets[offsets[i]:offsets[i + 1]], sorted, so a whole
+    scan's topology is two integer arrays plus the address list.
+    """
+
+    def __init__(self, nodes: List[str], offsets: array, targets: array):
+        self.nodes = nodes
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def build(cls, neighbors: Dict[str, Iterable[str]], nodes: Optional[List[str]] = None) -> "PeerGraph":
+        """Graph over `nodes` (the keys of neighbors by default), peers outside of it are dropped"""
+        nodes = list(neighbors) if nodes is None else nodes
+        ids = {address: i for i, address in enumerate(nodes)}
+        offsets = array("I", [0])
+        targets = array("I")
+
+        for i, address in enumerate(nodes):
+            targets.extend(sorted({ids[p] for p in neighbors.get(address, ()) if p in ids} - {i}))
+            offsets.append(len(targets))
+
+        return cls(nodes, offsets, targets)
+
+    def peers(self, i: int) -> array:
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def has_edge(self, u: int, v: int) -> bool:
+        lo, hi = self.offsets[u], self.offsets[u + 1]
+        i = bisect_left(self.targets, v, lo, hi)
+        return i < hi and self.targets[i] == v
+
+    def out_degrees(self) -> List[int]:
+        return [self.offsets[i + 1] - self.offsets[i] for i in range(len(self.nodes))]
+
+    def in_degrees(self) -> List[int]:
+        degrees = [0] * len(self.nodes)
+        for v in self.targets:
+            degrees[v] += 1
+        return degrees
+
+    def edges(self) -> Iterator[Tuple[int, int]]:
+        """Links between nodes, each pair once whether one or both of them listed the other"""
+        for u in range(len(self.nodes)):
+            for v in self.peers(u):
+                if u < v or not self.has_edge(v, u):
+                    yield u, v
+
+    def components(self) -> List[int]:
+        """Connected component of every node, ignoring edge direction, as the id of a member"""
+        parent = list(range(len(self.nodes)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for u in range(len(self.nodes)):
+            for v in self.peers(u):
+                ru, rv = find(u), find(v)
+                if ru != rv:
+                    parent[max(ru, rv)] = min(ru, rv)
+
+        return [find(i) for i in range(len(self.nodes))]
+
+    def reachable(self, sources: Iterable[int]) -> Tuple[int, int]:
+        """Nodes reachable from the sources following the peer lists, and the hops it takes"""
+        hops = [-1] * len(self.nodes)
+        queue = deque()
+        for s in sources:
+            if hops[s] < 0:
+                hops[s] = 0
+                queue.append(s)
+
+        reached, depth = len(queue), 0
+        while queue:
+            u = queue.popleft()
+            for v in self.peers(u):
+                if hops[v] < 0:
+                    hops[v] = depth = hops[u] + 1
+                    reached += 1
+                    queue.append(v)
+
+        return reached, depth
+
+    def analyze(self, sources: Iterable[str] = ()) -> dict:
+        """Degree distribution, connected components and reachability from the `sources` addresses"""
+        ids = {address: i for i, address in enumerate(self.nodes)}
+        source_ids = [ids[s] for s in sources if s in ids]
+        in_degrees = self.in_degrees()
+        sizes = sorted(Counter(self.components()).values(), reverse=True)
+        reached, hops = self.reachable(source_ids)
+
+        return {
+            "nodes": len(self.nodes),
+            "edges": len(self.targets),
+            "links": sum(1 for _ in self.edges()),
+            "out_degree": _degree_stats(self.out_degrees()),
+            "in_degree": _degree_stats(in_degrees),
+            "components": {
+                "count": len(sizes),
+                "largest": sizes[:TOP_COMPONENTS],
+                "isolated": sum(1 for s in sizes if s == 1)
+            },
+            "reachability": {
+                "sources": len(source_ids),
+                "reachable": reached,
+                "hops": hops,
+                # nodes no other node lists as a peer
+                "unlisted": sum(1 for d in in_degrees if d == 0)
+            }
+        }
+
+    def to_json(self) -> dict:
+        return {"nodes": self.nodes, "offsets": self.offsets.tolist(), "targets": self.targets.tolist()}
+
+    @classmethod
+    def from_json(cls, doc: dict) -> "PeerGraph":
+        return cls(doc["nodes"], array("I", doc["offsets"]), array("I", doc["targets"]))
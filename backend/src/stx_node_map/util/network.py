@@ -0,0 +1,38 @@
+import os
+import re
+from typing import List
+
+from stx_node_map.util import assert_env_vars
+
+# first path segments of the API's own routes, no network can be named like one of them
+RESERVED_NAMES = ("nodes", "stats", "status", "graph", "history", "events", "networks")
+
+NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+
+def network_names() -> List[str]:
+    """Networks of this deployment, from NETWORKS (comma-separated) or else NETWORK
+
+    The first one is the primary network: its data files stay in the data
+    directory itself and the API serves it on the routes without a prefix.
+    """
+    names = [n.strip() for n in (os.environ.get("NETWORKS") or assert_env_vars("NETWORK")).split(",") if n.strip()]
+
+    for name in names:
+        if not NAME_PATTERN.match(name) or name in RESERVED_NAMES:
+            raise AssertionError("Invalid network name {}".format(name))
+
+    if len(set(names)) != len(names):
+        raise AssertionError("NETWORKS lists a network twice")
+
+    return names
+
+
+def network_dir(data_dir: str, names: List[str], name: str) -> str:
+    """Directory of a network's data files, a subdirectory named after it unless it is the primary one"""
+    return data_dir if name == names[0] else os.path.join(data_dir, name)
+
+
+def env_suffix(name: str) -> str:
+    """Suffix of the per-network environment variables, e.g. DISCOVERER_SEED_NODES_TESTNET"""
+    return name.upper().replace("-", "_")
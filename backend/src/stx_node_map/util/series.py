@@ -0,0 +1,177 @@
+import sqlite3
+import sys
+from array import array
+from collections import Counter, defaultdict
+from datetime import datetime
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# connection statuses and how they are stored
+STATUS_CODES = {"offline": 0, "p2p_only": 1, "api": 2}
+
+# one node's history is stored in chunks of one UTC day
+CHUNK_SECONDS = 86400
+
+# (unix time, nodes up, observations, burn block height or 0, version id or 0)
+Sample = Tuple[int, int, int, int, int]
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS versions (id INTEGER PRIMARY KEY, version TEXT NOT NULL UNIQUE);"
+    "CREATE TABLE IF NOT EXISTS observations ("
+    "address TEXT NOT NULL, t INTEGER NOT NULL, status INTEGER NOT NULL, height INTEGER NOT NULL, "
+    "version INTEGER NOT NULL, n INTEGER NOT NULL DEFAULT 1);"
+    "CREATE INDEX IF NOT EXISTS observations_t ON observations (t);"
+    "CREATE INDEX IF NOT EXISTS observations_address ON observations (address, t);"
+    "CREATE TABLE IF NOT EXISTS chunks ("
+    "address TEXT NOT NULL, start INTEGER NOT NULL, resolution INTEGER NOT NULL, "
+    "times BLOB NOT NULL, up BLOB NOT NULL, total BLOB NOT NULL, heights BLOB NOT NULL, versions BLOB NOT NULL, "
+    "PRIMARY KEY (address, start));"
+    "CREATE INDEX IF NOT EXISTS chunks_start ON chunks (start);"
+)
+
+
+# raw observation rows as samples, a row stands for its n identical observations
+RAW_SAMPLE = "address, t, CASE WHEN status > 0 THEN n ELSE 0 END, n, height, version"
+
+
+def _pack(typecode: str, values) -> bytes:
+    arr = array(typecode, values)
+    if sys.byteorder == "big":
+        arr.byteswap()  # always stored little-endian
+    return arr.tobytes()
+
+
+def _unpack(typecode: str, blob: bytes) -> array:
+    arr = array(typecode)
+    arr.frombytes(blob)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+def _deltas(values: List[int]) -> List[int]:
+    return [v - p for p, v in zip([0] + values[:-1], values)]
+
+
+def encode_chunk(start: int, samples: List[Sample]) -> Tuple[bytes, bytes, bytes, bytes, bytes]:
+    """Column-encode the samples of one chunk
+
+    Times (as offsets from the chunk start) and heights are delta-encoded,
+    so a steady node costs a few bytes per sample: 4 for the time, 2 + 2 for
+    the up/total counts, 8 for the height delta and 2 for the version id.
+    """
+    return (
+        _pack("I", _deltas([s[0] - start for s in samples])),
+        _pack("H", [s[1] for s in samples]),
+        _pack("H", [s[2] for s in samples]),
+        _pack("q", _deltas([s[3] for s in samples])),
+        _pack("H", [s[4] for s in samples]),
+    )
+
+
+def decode_chunk(start: int, times: bytes, up: bytes, total: bytes, heights: bytes, versions: bytes) -> List[Sample]:
+    return list(zip(
+        (start + t for t in accumulate(_unpack("I", times))),
+        _unpack("H", up),
+        _unpack("H", total),
+        accumulate(_unpack("q", heights)),
+        _unpack("H", versions),
+    ))
+
+
+def downsample(samples: List[Sample], resolution: int) -> List[Sample]:
+    """Merge samples into one per `resolution` seconds, keeping the last height and version"""
+    merged: List[Sample] = []
+
+    for t, up, total, height, version in samples:
+        bucket = t - t % resolution
+        if merged and merged[-1][0] == bucket:
+            _, prev_up, prev_total, prev_height, prev_version = merged[-1]
+            merged[-1] = (bucket, prev_up + up, prev_total + total, height or prev_height, version or prev_version)
+        else:
+            merged.append((bucket, up, total, height, version))
+
+    return merged
+
+
+def read_samples(conn: sqlite3.Connection, since: int, until: int,
+                 address: Optional[str] = None) -> Iterator[Tuple[str, List[Sample]]]:
+    """(address, samples in [since, until)) for every node, one node in memory at a time
+
+    Closed days come from the compacted chunks, the current day from the raw
+    observations not compacted yet.
+    """
+    where = " AND address = ?" if address is not None else ""
+    args = [address] if address is not None else []
+
+    chunks = conn.execute(
+        "SELECT address, start, times, up, total, heights, versions FROM chunks "
+        "WHERE start > ? AND start < ?" + where + " ORDER BY address, start",
+        [since - CHUNK_SECONDS, until] + args
+    )
+    raw = conn.execute(
+        "SELECT " + RAW_SAMPLE + " FROM observations WHERE t >= ? AND t < ?" + where + " ORDER BY address, t",
+        [since, until] + args
+    )
+
+    chunk = next(chunks, None)
+    row = next(raw, None)
+
+    while chunk is not None or row is not None:
+        current = min(r[0] for r in (chunk, row) if r is not None)
+        samples: List[Sample] = []
+
+        while chunk is not None and chunk[0] == current:
+            samples.extend(s for s in decode_chunk(*chunk[1:]) if since <= s[0] < until)
+            chunk = next(chunks, None)
+
+        while row is not None and row[0] == current:
+            samples.append(row[1:])
+            row = next(raw, None)
+
+        yield current, samples
+
+
+def version_names(conn: sqlite3.Connection) -> Dict[int, str]:
+    names = {0: "unknown"}
+    names.update(conn.execute("SELECT id, version FROM versions"))
+    return names
+
+
+def uptime(conn: sqlite3.Connection, since: int, until: int, address: Optional[str] = None) -> List[dict]:
+    """Share of observations in which each node answered on its API or P2P port"""
+    result = []
+
+    for node, samples in read_samples(conn, since, until, address):
+        total = sum(s[2] for s in samples)
+        if total:
+            result.append({
+                "address": node,
+                "uptime": round(sum(s[1] for s in samples) / total, 4),
+                "observations": total
+            })
+
+    return result
+
+
+def version_adoption(conn: sqlite3.Connection, since: int, until: int, bucket: int) -> List[dict]:
+    """Number of nodes running each version, per `bucket` seconds
+
+    A node counts once per bucket, with the last version it reported in it.
+    """
+    counts: Dict[int, Counter] = defaultdict(Counter)
+
+    for _, samples in read_samples(conn, since, until):
+        last: Dict[int, int] = {}
+        for t, _, _, _, version in samples:
+            key = t - t % bucket
+            last[key] = version or last.get(key, 0)
+
+        for key, version in last.items():
+            counts[key][version] += 1
+
+    names = version_names(conn)
+    return [{
+        "t": datetime.utcfromtimestamp(key).isoformat(),
+        "versions": {names.get(v, "unknown"): n for v, n in counts[key].most_common()}
+    } for key in sorted(counts)]
@@ -0,0 +1,108 @@
+import re
+from functools import lru_cache, total_ordering
+from typing import Optional, Tuple
+
+# distinct version strings are few, a network has a few dozen at most
+CACHE_SIZE = 1024
+
+_LEADING_DIGITS = re.compile(r"\d*")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def version_key(version: Optional[str]) -> Tuple[int, ...]:
+    """Numeric sort key of a version number: "3.1.0.0.10" sorts after "3.1.0.0.9" """
+    if not version:
+        return ()
+
+    return tuple(int(_LEADING_DIGITS.match(p).group() or 0) for p in version.split("."))
+
+
+@total_ordering
+class ServerVersion:
+    """A parsed server_version string, ordered by version number
+
+    Instances are immutable and shared: parse_server_version hands out the
+    same object for the same string.
+    """
+
+    __slots__ = ("raw", "version", "commit_hash", "build_type", "platform", "key")
+
+    def __init__(self, raw: Optional[str], version: Optional[str] = None, commit_hash: Optional[str] = None,
+                 build_type: Optional[str] = None, platform: Optional[str] = None):
+        for name, value in (("raw", raw), ("version", version), ("commit_hash", commit_hash),
+                            ("build_type", build_type), ("platform", platform), ("key", version_key(version))):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ServerVersion is immutable")
+
+    def _order(self) -> tuple:
+        return self.key, self.raw or ""
+
+    def __eq__(self, other):
+        if not isinstance(other, ServerVersion):
+            return NotImplemented
+        return self._order() == other._order()
+
+    def __lt__(self, other):
+        if not isinstance(other, ServerVersion):
+            return NotImplemented
+        return self._order() < other._order()
+
+    def __hash__(self):
+        return hash(self._order())
+
+    def __repr__(self):
+        return "ServerVersion({!r})".format(self.raw)
+
+    def to_json(self) -> dict:
+        """The `version` field of the node documents"""
+        return {
+            "version": self.version,
+            "commit_hash": self.commit_hash,
+            "build_type": self.build_type,
+            "platform": self.platform
+        }
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_server_version(server_version: Optional[str]) -> ServerVersion:
+    """Split a server_version string into version, commit_hash, build_type and platform
+
+    Example: "stacks-node 3.3.0.0.3 (6048975+, release build, linux [x86_64])"
+    """
+    if not server_version:
+        return ServerVersion(server_version)
+
+    version = commit_hash = build_type = platform = None
+
+    # Extract version number - find the numeric version part after "stacks-node "
+    for part in server_version.split():
+        # Look for a part that starts with a digit (version number)
+        if part[0].isdigit():
+            # Extract just the version, removing any trailing parenthesis
+            version = part.split("(")[0]
+            break
+
+    # Extract commit, build type, and platform from parentheses
+    if "(" in server_version and ")" in server_version:
+        paren_content = server_version[server_version.find("(") + 1:server_version.find(")")]
+        paren_parts = [p.strip() for p in paren_content.split(",")]
+
+        if paren_parts[0]:
+            # Commit hash (e.g., "master:abc123" or "abc123" or "6048975+")
+            commit_hash = paren_parts[0].split(":")[1] if ":" in paren_parts[0] else paren_parts[0]
+
+        # Build type might be "release build" or just "release"
+        for part in paren_parts[1:]:
+            if "release" in part.lower() or "debug" in part.lower():
+                build_type = part
+                break
+
+        # Platform is usually the last part with brackets
+        for part in paren_parts:
+            if "[" in part and "]" in part:
+                platform = part
+                break
+
+    return ServerVersion(server_version, version, commit_hash, build_type, platform)